@@ -0,0 +1,111 @@
+"""thin client of the another_manga_downloader daemon, only needs the standard library"""
+
+import sys
+import json
+import socket
+import argparse
+import http.client
+
+DEFAULT_ADDRESS = "127.0.0.1:8642"
+
+
+class UnixConnection(http.client.HTTPConnection):
+    """http connection over a unix socket"""
+
+    def __init__(self, path: str) -> None:
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def request(address: str, method: str, path: str, body: dict | None = None) -> tuple[int, object]:
+    """send a request to the daemon at address and return the status and the json answer"""
+
+    if "/" in address:
+        connection = UnixConnection(address)
+    else:
+        host, _, port = address.rpartition(":")
+        connection = http.client.HTTPConnection(host or "127.0.0.1", int(port), timeout=10)
+    data = json.dumps(body or {}).encode()
+    try:
+        connection.request(method, path, data, {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read() or b"null")
+    finally:
+        connection.close()
+
+
+def print_jobs(jobs: list[dict]) -> None:
+    """print the jobs as a table"""
+
+    print(f"{'id':>5}  {'status':<10}{'priority':>8}  {'chapters':>9}  url")
+    for job in jobs:
+        progress = f"{job['done']}/{job['total']}"
+        print(f"{job['id']:>5}  {job['status']:<10}{job['priority']:>8}  {progress:>9}  {job['url']}")
+        if job["error"]:
+            print(f"{'':>7}{job['error']}")
+
+
+def main(args: argparse.Namespace) -> int:
+    """run the command, return the exit code"""
+
+    if args.command == "submit":
+        body = {"urls": args.urls, "chapters": args.chapters, "priority": args.priority}
+        status, answer = request(args.address, "POST", "/jobs", body)
+    elif args.command == "list":
+        status, answer = request(args.address, "GET", "/jobs")
+        if status == 200:
+            print_jobs(answer)
+            return 0
+    elif args.command == "status":
+        status, answer = request(args.address, "GET", "/status")
+        if status == 200:
+            print(answer.pop("summary"))
+            print(json.dumps(answer, indent=2))
+            return 0
+    elif args.command == "priority":
+        status, answer = request(
+            args.address, "POST", f"/jobs/{args.id}/priority", {"priority": args.priority}
+        )
+    elif args.command == "bandwidth":
+        body = {"rate": args.rate}
+        if args.host_rate is not None:
+            body["host_rate"] = args.host_rate
+        status, answer = request(args.address, "POST", "/bandwidth", body)
+    else:
+        status, answer = request(args.address, "POST", f"/jobs/{args.id}/{args.command}")
+
+    print(json.dumps(answer))
+    return 0 if status < 400 else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="amd_client", description="control the another_manga_downloader daemon"
+    )
+    parser.add_argument("--address", default=DEFAULT_ADDRESS, help="host:port or unix socket path")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="queue the mangas at urls")
+    submit.add_argument("urls", nargs="+")
+    submit.add_argument("-c", "--chapters", default="", help='selection, e.g. "latest 5"')
+    submit.add_argument("-p", "--priority", type=int, default=0, help="higher runs first")
+    commands.add_parser("list", help="list the jobs")
+    commands.add_parser("status", help="show the state of the daemon")
+    for command in ("pause", "resume", "cancel"):
+        commands.add_parser(command, help=f"{command} a job").add_argument("id", type=int)
+    priority = commands.add_parser("priority", help="change the priority of a job")
+    priority.add_argument("id", type=int)
+    priority.add_argument("priority", type=int)
+    bandwidth = commands.add_parser("bandwidth", help='change the bandwidth, e.g. "2M", 0 unlimited')
+    bandwidth.add_argument("rate")
+    bandwidth.add_argument("--host-rate")
+
+    try:
+        sys.exit(main(parser.parse_args()))
+    except OSError as excp:
+        print(f"Cannot reach the daemon: {excp}")
+        sys.exit(1)
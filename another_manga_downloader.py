@@ -1,21 +1,49 @@
 """manga downloader written in Python"""
 
 import os
-import sys
 import argparse
-from multiprocessing.pool import ThreadPool
 import queue
 import threading
 import signal
 import ctypes
-from zipfile import ZipFile
-import requests
-import unicurses as uc
-from manga_websites import create_manga_dict, get_manga_website
-
-
-if sys.version_info.major == 3 and sys.version_info.minor >= 13 and sys._is_gil_enabled():
-    print("Python GIL is enabled, might experience performance")
+import time
+import shutil
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from typing import TYPE_CHECKING, Callable, Iterator
+from urllib.parse import urlsplit
+from manga_websites import (
+    Selection,
+    Page,
+    capabilities_of,
+    resolve,
+    create_manga_dict,
+    get_manga_website,
+)
+from downloader import (
+    ChapterJob,
+    PageScheduler,
+    SESSIONS,
+    METRICS,
+    CONCURRENCY,
+    BANDWIDTH,
+    LIBRARY,
+    CPU,
+    Reencoder,
+    DONE,
+    FAILED,
+    verify_archive,
+    scrub,
+    quarantine,
+    QUARANTINE,
+    library_folder,
+    parse_rate,
+)
+
+if TYPE_CHECKING:
+    # the asyncio engine, the job queue and the api are imported where they are used
+    from downloader import AsyncEngine, JobQueue
 
 # environment variables
 
@@ -23,8 +51,13 @@ if sys.version_info.major == 3 and sys.version_info.minor >= 13 and sys._is_gil_
 class Environment:
     """class that defined environment variables"""
 
-    def __init__(self, timeout) -> None:
+    def __init__(self, timeout, workers, max_workers) -> None:
         self.timeout = timeout
+        self.workers = workers  # starting requests in flight for each host
+        self.max_workers = max_workers  # upper bound of the adaptive limits
+        self.engine = "threads"
+        self.selection = Selection()  # chapters to download, every one by default
+        self.reencoder: Reencoder | None = None  # optional re-encoding of the pages
         self.stop = 0
         self.print_queue = queue.Queue()
         self.get_manga = create_manga_dict(timeout)
@@ -41,25 +74,62 @@ class Environment:
 
         signal.signal(signal.SIGINT, sigint_main)
 
+        def sigusr_main(signum, *args) -> None:
+            """signal USR1 and USR2 handler, double or halve the bandwidth"""
+
+            factor = 2 if signum == signal.SIGUSR1 else 0.5
+            BANDWIDTH.configure(
+                rate=BANDWIDTH.total.rate * factor, host_rate=BANDWIDTH.host_rate * factor
+            )
+            self.print_queue.put(("message", f"bandwidth {BANDWIDTH.describe()}", None))
+
+        # the bandwidth can be changed while downloading: kill -USR1 / -USR2 PID
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, sigusr_main)
+            signal.signal(signal.SIGUSR2, sigusr_main)
+
     def quit(self) -> None:
         """quit environment"""
 
+        METRICS.close_trace()
+        LIBRARY.close()
+        CPU.close()
         if self.stop:
             print("\nProgram terminated, re-run to resume.")
 
 
-ENV = Environment(timeout=10)
+ENV = Environment(timeout=10, workers=8, max_workers=32)
+
+uc = None  # unicurses, imported when the search interface is first opened
+
+
+def load_curses() -> None:
+    """import unicurses for the search interface"""
+
+    global uc
+    if uc is None:
+        import unicurses as uc
 
 
 class SearchClass:
-    """class contaning variables useful for the search printer"""
+    """state of the search interface, shared by the thread reading the keys,
+    the renderer and the fetcher
+    the results form a virtual list: only the rows on the screen are drawn, only
+    the ones that changed are rewritten, and more results are asked to the
+    adapter as the cursor approaches the end of the ones loaded"""
 
     def __init__(self, manga_website: str) -> None:
+        self.adapter = ENV.get_manga[manga_website]
         self.word = ""
-        self.url_manga = ""
-        self._index = 0
-        self._print_list: list[tuple[str, str]] = []
-        self.queue: queue.Queue[int] = queue.Queue(maxsize=1)
+        self.results: list[tuple[str, str]] = []
+        self.complete = True  # the adapter has no more results than these
+        self.index = 0  # position of the cursor in the results
+        self.top = 0  # first result on the screen
+        self.wanted = 0  # results asked to the adapter, 0 when none is missing
+        self.closed = False
+        self.lock = threading.Lock()
+        self.redraw = threading.Event()
+        self.fetch = threading.Event()
 
         # enable the curses module
         uc.cbreak()
@@ -67,45 +137,21 @@ class SearchClass:
         uc.keypad(uc.stdscr, True)
         uc.curs_set(0)
         uc.leaveok(uc.stdscr, True)
-
-        # start the printer thread
-        self.printer_thread = threading.Thread(
-            target=search_printer,
-            daemon=True,
-            args=(manga_website, self),
-        )
-        self.printer_thread.start()
-
-    @property
-    def print_list(self) -> list[tuple[str, str]]:
-        """print_list return"""
-
-        return self._print_list
-
-    @print_list.setter
-    def print_list(self, new_list: list[tuple[str, str]]) -> None:
-        """print_list setter"""
-
-        self._print_list = new_list
-        self.index = min(self.index, max(len(new_list) - 1, 0))
-
-    @property
-    def index(self) -> int:
-        """index return"""
-
-        return self._index
-
-    @index.setter
-    def index(self, val: int) -> None:
-        """index setter"""
-
-        if 0 <= val < min(self.rows - 2, len(self.print_list)):
-            self._index = val
-
-        if self.index < len(self.print_list):
-            self.url_manga = self.print_list[self.index][1]
-        else:
-            self.url_manga = ""
+        # the keys are read from stdscr, which is refreshed once and never
+        # drawn again, everything else is drawn on a window by the renderer
+        uc.refresh()
+        self.size = (self.rows, self.columns)
+        self.window = uc.newwin(self.rows, self.columns, 0, 0)
+        uc.leaveok(self.window, True)
+        self.drawn: list[str] = []  # text of each row of the window
+
+        self.threads = [
+            threading.Thread(target=search_printer, daemon=True, args=(self,)),
+            threading.Thread(target=search_fetcher, daemon=True, args=(self,)),
+        ]
+        for thread in self.threads:
+            thread.start()
+        self.redraw.set()
 
     @property
     def columns(self) -> int:
@@ -119,17 +165,58 @@ class SearchClass:
 
         return uc.getmaxy(uc.stdscr)
 
-    def queue_put(self) -> None:
-        """put 1 in queue if it is empty"""
+    @property
+    def page(self) -> int:
+        """return the number of results on the screen"""
+
+        return max(self.rows - 2, 1)
 
-        if self.queue.empty():
-            self.queue.put(1)
+    @property
+    def url_manga(self) -> str:
+        """return the url of the result under the cursor, "" if there is none"""
+
+        with self.lock:
+            if self.index < len(self.results):
+                return self.results[self.index][1]
+            return ""
+
+    def type(self, word: str) -> None:
+        """search word from the first result"""
+
+        with self.lock:
+            self.word = word
+            self.index = self.top = 0
+            self.complete = False
+            self.wanted = 2 * self.page
+        self.fetch.set()
+        self.redraw.set()
+
+    def move(self, delta: int) -> None:
+        """move the cursor by delta results, scrolling and loading more as needed"""
+
+        page = self.page
+        with self.lock:
+            self.index = min(max(self.index + delta, 0), max(len(self.results) - 1, 0))
+            if self.index < self.top:
+                self.top = self.index
+            elif self.index >= self.top + page:
+                self.top = self.index - page + 1
+            if not self.complete and self.index >= len(self.results) - page:
+                # the adapters return a prefix of the results, growing it
+                # geometrically keeps a long scroll linear
+                self.wanted = max(self.wanted, len(self.results) + max(2 * page, len(self.results)))
+                self.fetch.set()
+        self.redraw.set()
 
     def quit(self) -> None:
         """quit class"""
 
-        self.queue.put(0)
-        self.printer_thread.join()
+        with self.lock:
+            self.closed = True
+        self.redraw.set()
+        self.fetch.set()
+        # the fetcher may be waiting on the website, it is left behind
+        self.threads[0].join()
         uc.clear()
         uc.endwin()
 
@@ -137,167 +224,609 @@ class SearchClass:
 # functions
 
 
-def printer(manga_name: str, number_chapters: int) -> None:
-    """function that updates the count of the executed chapters"""
+def printer() -> None:
+    """function that prints the progress of every manga being downloaded
+    tokens: ("manga", key, chapters) adds a manga, ("chapter", key, error)
+    counts a chapter, ("message", text, None) prints text, None ends the batch,
+    the key of a manga is its url and name, see progress_key"""
 
     if ENV.stop:
         return
 
-    failed = []
-    ENV.print_queue.put(None)
-
-    print(f"- {manga_name}:")
+    progress: dict[tuple[str, str], list] = {}  # (url, name) -> [done, total, failed]
 
-    for i in range(number_chapters + 1):
+    while True:
         token = ENV.print_queue.get()
         if token == 1:
             return
-        if token:
-            failed.append(token)
-        print(f"  {i} / {number_chapters}", end="\r")
-
-    print()
-    if failed:
-        print("The following chapters have failed.")
-        for chapter in failed:
-            print(chapter)
-    else:
-        print("No chapter has failed.")
+        if token is None:
+            break
 
+        kind, key, value = token
+        print("\r\033[K", end="")
+        if kind == "message":
+            print(key)
+        elif kind == "manga":
+            progress[key] = [0, value, []]
+        else:
+            entry = progress[key]
+            entry[0] += 1
+            if value:
+                entry[2].append(value)
+            if entry[0] == entry[1]:
+                del progress[key]
+                print(f"- {key[1]}: {entry[0]} / {entry[1]}")
+                if entry[2]:
+                    print("The following chapters have failed.")
+                    for chapter in entry[2]:
+                        print(chapter)
+                else:
+                    print("No chapter has failed.")
+
+        # a single status line for the mangas still downloading
+        status = ", ".join(
+            f"{name} {done} / {total}" for (_, name), (done, total, _) in progress.items()
+        )
+        if status:
+            line = f"  {status}  limits {CONCURRENCY.describe()}"
+            if BANDWIDTH.total.rate or BANDWIDTH.host_rate:
+                line += f"  bandwidth {BANDWIDTH.describe()}"
+            print(line[: shutil.get_terminal_size().columns - 1] + "\033[K", end="\r")
 
-def download_and_zip(
-    chapter: dict, folder_path: str, manga: dict[str, str | list[dict]]
-) -> None:
-    """given a chapter and a path, create the zip file
-    add a token to the queue when the process is done"""
+    print("\r\033[K", end="")
 
-    if ENV.stop:
-        return
 
-    chapter_path = os.path.join(folder_path, chapter["name"])
-    zip_path = chapter_path + ".cbz"
+def progress_key(manga: dict, group: object = None) -> object:
+    """return the key of the progress of a manga, its group when it has one, such
+    as the job id in the daemon, otherwise its url and name since the same name
+    can come from two websites"""
 
-    if os.path.exists(zip_path):
-        ENV.print_queue.put(None)
-        return
+    return (manga["url"], manga["name"]) if group is None else group
+
+
+def report_chapter(job: ChapterJob) -> None:
+    """count the chapter in the progress of its manga"""
+
+    error = f"{job.name} {job.error}" if job.error else None
+    ENV.print_queue.put(("chapter", progress_key(job.manga, job.group), error))
 
-    os.makedirs(chapter_path, exist_ok=True)
 
-    # DOWNLOAD
-    pages = []
-    for page_str, image_link in ENV.get_manga[manga["website"]].img_generator(
-        chapter, manga
-    ):
-        if not page_str:
-            ENV.print_queue.put(f"{chapter['name']} error type '{image_link}'")
+def resolve_chapter(job: ChapterJob) -> Iterator[Page]:
+    """yield the pages of a chapter, registering their order in the archive
+    the pages of a website knowing the page count are all resolved at once,
+    the other ones are yielded as the adapter finds them"""
+
+    adapter = ENV.get_manga[job.manga["website"]]
+    capabilities = capabilities_of(adapter)
+    start = time.perf_counter()
+    pages = iter(resolve(adapter, job.chapter, job.manga))
+    job.record_stage("resolve", time.perf_counter() - start)
+    hosts = set()
+    while True:
+        # only the time spent in the adapter counts as resolution
+        start = time.perf_counter()
+        page = next(pages, None)
+        job.record_stage("resolve", time.perf_counter() - start)
+        if page is None:
             return
+        host = urlsplit(page.url).netloc
+        if capabilities.concurrency and host not in hosts:
+            hosts.add(host)
+            CONCURRENCY.cap(page.url, capabilities.concurrency)
+        job.archive.expect(page.number)
+        yield page
 
-        file_path = os.path.join(chapter_path, page_str + ".png")
-        if not os.path.exists(file_path):
-            try:
-                response = requests.get(image_link, stream=True, timeout=ENV.timeout)
-            except Exception as excp:
-                ENV.print_queue.put(f"{chapter['name']} error type: {excp}")
-                return
 
-            with open(file_path, "wb") as page_file:
-                for chunk in response.iter_content(1024):
-                    page_file.write(chunk)
+def until_stopped(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """yield the chunks, interrupting the page when the program is stopped"""
 
+    for chunk in chunks:
         if ENV.stop:
-            return
+            raise InterruptedError("program stopped")
+        yield chunk
 
-        pages.append(file_path)
 
-    # ZIP
-    with ZipFile(zip_path, "a") as zip_file:
-        for page in pages:
-            if ENV.stop:
-                break
-            page_path = os.path.join(chapter_path, page)
-            zip_file.write(page_path, page)
+def download_page(job: ChapterJob, page_str: str, image_link: str) -> None:
+    """stream a single page of a chapter into its archive
+    a page left partial by an interrupted run is continued with a Range request"""
 
-    if ENV.stop:
-        if os.path.exists(zip_path):
-            os.remove(zip_path)
+    if job.archive.has(page_str):
         return
 
-    # remove folder
-    for page in pages:
-        os.remove(page)
-    if not os.listdir(chapter_path):
-        os.rmdir(chapter_path)
-
-    # save chapter name is fail
-    if not os.path.exists(zip_path):
-        ENV.print_queue.put(chapter["name"])
-    else:
-        ENV.print_queue.put(None)
+    start = time.perf_counter()
+    with SESSIONS.get(
+        image_link, stream=True, timeout=ENV.timeout, headers=job.request_headers(page_str)
+    ) as response:
+        response.raise_for_status()
+        job.manifest.record(page_str, response.status_code, response.headers)
+        chunks = until_stopped(SESSIONS.iter_content(response, 1 << 16))
+        if response.status_code == 206:
+            chunks = chain(job.archive.partial_chunks(page_str), chunks)
+        size = job.archive.add_page(page_str, chunks)
+    job.record_page(start, time.perf_counter(), size)
+
+
+def zip_chapter(job: ChapterJob) -> None:
+    """complete the archive of a chapter once the last page has landed
+    add a token to the queue when the process is done"""
 
+    if ENV.stop or job.error or job.cancelled:
+        job.suspend()
+        if not ENV.stop:
+            if job.cancelled:
+                job.fail("cancelled")
+            else:
+                LIBRARY.record(job.manga, job.name, FAILED)
+            METRICS.record_chapter(**job.report())
+            report_chapter(job)
+        return
 
-def download_manga(manga: dict[str, str | list[dict]]) -> None:
-    """main function"""
+    truncated = job.manifest.mismatches(job.archive.sizes)
+    if truncated:
+        job.archive.abort()
+        job.manifest.remove()
+        job.fail(f"truncated pages: {', '.join(truncated)}")
+        METRICS.record_chapter(**job.report())
+        LIBRARY.record(job.manga, job.name, FAILED)
+        report_chapter(job)
+        return
 
-    if ENV.stop:
+    start = time.perf_counter()
+    try:
+        job.archive.close()
+    except Exception as excp:
+        job.suspend()
+        job.fail(f"error type: {excp}")
+        job.record_stage("zip", time.perf_counter() - start)
+        METRICS.record_chapter(**job.report())
+        LIBRARY.record(job.manga, job.name, FAILED)
+        report_chapter(job)
         return
 
+    job.manifest.remove()
+    job.record_stage("zip", time.perf_counter() - start)
+    if ENV.reencoder is not None:
+        reencode_chapter(job)
+    METRICS.record_chapter(**job.report())
+    LIBRARY.record(job.manga, job.name, DONE)
+    report_chapter(job)
+
+
+def reencode_chapter(job: ChapterJob) -> None:
+    """re-encode the pages of a finished chapter on the process pool"""
+
+    start = time.perf_counter()
+    name = f"{job.manga['name']} {job.name}"
+    try:
+        saved, failures = ENV.reencoder.reencode(job.zip_path)
+    except Exception as excp:
+        # the archive is still complete, the pages just stay as served
+        ENV.print_queue.put(("message", f"{name} not re-encoded, error type: {excp}", None))
+    else:
+        job.stats["saved"] = saved
+        job.stats["unencoded"] = len(failures)
+        message = f"{name} re-encoded, {saved / 1e6:.2f} MB saved"
+        if failures:
+            message += f", {len(failures)} pages kept as served, error type: {failures[0]}"
+        ENV.print_queue.put(("message", message, None))
+    job.record_stage("encode", time.perf_counter() - start)
+
+
+def create_scheduler() -> "PageScheduler | AsyncEngine":
+    """return the scheduler of the selected engine"""
+
+    if ENV.engine == "asyncio":
+        from downloader.async_engine import AsyncEngine
+
+        return AsyncEngine(
+            resolve=resolve_chapter,
+            finalize=zip_chapter,
+            stopped=lambda: ENV.stop,
+            timeout=ENV.timeout,
+        )
+    return PageScheduler(
+        resolve=resolve_chapter,
+        download=download_page,
+        finalize=zip_chapter,
+        stopped=lambda: ENV.stop,
+        workers=ENV.max_workers,
+        max_in_flight=2 * ENV.max_workers,
+    )
+
+
+def queue_manga(
+    scheduler: "PageScheduler | AsyncEngine",
+    manga: dict[str, str | list[dict]],
+    selection: Selection | None = None,
+    cancel: threading.Event | None = None,
+    group: object = None,
+) -> int:
+    """submit the selected chapters of manga missing from the library, the
+    selection defaults to the one of ENV, return the number of chapters
+    the chapters of a group, such as a job of the daemon, are reported under it
+    instead of the name of the manga and share their final pass and retries"""
+
     # create folder if does not exists
-    home = os.path.expanduser("~")
-    mangas_path = os.path.join(home, "Mangas")
+    mangas_path = library_folder()
     os.makedirs(mangas_path, exist_ok=True)
     assert isinstance(manga["name"], str)
     folder_path = os.path.join(mangas_path, manga["name"])
     os.makedirs(folder_path, exist_ok=True)
 
-    # add more to the list of chapters
-    list_chapters = [
-        (chapter, folder_path, manga) for chapter in manga["list_chapters"]
-    ]
-    number_chapters = len(list_chapters)
+    # the selection needs only the list of chapters, and the chapters already
+    # in the library are not even checked
+    LIBRARY.track(manga)
+    chapters = manga["list_chapters"]
+    selection = ENV.selection if selection is None else selection
+    if selection:
+        chapters = selection.apply(chapters, LIBRARY.known(manga))
+    chapters = LIBRARY.missing(manga, folder_path, chapters)
+    if not chapters:
+        ENV.print_queue.put(("message", f"- {manga['name']}: up to date", None))
+        return 0
+
+    ENV.print_queue.put(("manga", progress_key(manga, group), len(chapters)))
+    adapter = ENV.get_manga[manga["website"]]
+    capabilities = capabilities_of(adapter)
+    headers = capabilities.request_headers(adapter.page)
+    jobs = [ChapterJob(chapter, folder_path, manga) for chapter in chapters]
+    for job in jobs:
+        job.cancel = cancel
+        job.group = group
+        job.headers = headers
+        job.ranges = capabilities.ranges
+
+    # archives found on disk but not in the library are checked in parallel
+    existing = [job.zip_path for job in jobs if os.path.exists(job.zip_path)]
+    verified = dict(zip(existing, CPU.map(verify_archive, existing))) if existing else {}
+
+    for job in jobs:
+        if ENV.stop:
+            break
+        if verified.get(job.zip_path):
+            LIBRARY.record(manga, job.name, DONE)
+            report_chapter(job)
+            continue
+        scheduler.submit(job)
+    return len(jobs)
 
-    # send all the processes to a pool
-    printer_thread = threading.Thread(
-        target=printer, daemon=True, args=(manga["name"], number_chapters)
-    )
+
+def fetch_manga(
+    website: str, url: str, names: set[str] | None = None
+) -> dict[str, str | list[dict]]:
+    """create the manga at url, with only the chapters in names if given"""
+
+    manga = ENV.get_manga[website].create_manga(url)
+    if names is not None:
+        manga["list_chapters"] = [
+            chapter for chapter in manga["list_chapters"] if chapter["name"] in names
+        ]
+    return manga
+
+
+def download_batch(sources: list[tuple[str, Callable[[], dict[str, str | list[dict]]]]]) -> None:
+    """download the mangas created by sources, given with a label for errors
+    the next mangas are created while the chapters of the previous ones are
+    downloading, and every page of every manga goes through the same scheduler"""
+
+    if ENV.stop or not sources:
+        return
+
+    METRICS.reset()
+    printer_thread = threading.Thread(target=printer, daemon=True)
     printer_thread.start()
 
-    # start processing pool
-    with ThreadPool(processes=8) as pool:
-        pool.starmap(download_and_zip, list_chapters)
+    scheduler = create_scheduler()
+    pool = ThreadPoolExecutor(ENV.workers, "manga")
+    futures = [pool.submit(create) for _, create in sources]
+    for (label, _), future in zip(sources, futures):
+        if ENV.stop:
+            break
+        try:
+            manga = future.result()
+        except Exception as excp:
+            message = f"- {label}: cannot be checked, error type: {excp}"
+            ENV.print_queue.put(("message", message, None))
+            continue
+        queue_manga(scheduler, manga)
+    pool.shutdown(wait=True, cancel_futures=True)
+
+    scheduler.join()
+    ENV.print_queue.put(None)
 
     printer_thread.join()
+    if not ENV.stop:
+        print(METRICS.summary())
+        print(SESSIONS.summary())
 
 
-def search_printer(manga_website: str, search_class: SearchClass) -> None:
-    """async search printer"""
+def update_library() -> None:
+    """download the new chapters of every manga in the library"""
 
-    print_win = uc.newwin(search_class.rows - 2, search_class.columns, 2, 0)
-    uc.leaveok(print_win, True)
+    tracked = LIBRARY.mangas()
+    if not tracked:
+        print("No manga in the library, download one first.")
+        return
+    print(f"Checking {len(tracked)} mangas")
+    download_batch([(name, partial(fetch_manga, website, url)) for url, website, name in tracked])
 
-    while search_class.queue.get():
-        search_class.print_list = ENV.get_manga[manga_website].print_list(
-            search_class.word, search_class.rows - 2
-        )
 
-        columns_len = search_class.columns
+def verify_library(action: str) -> None:
+    """check every archive of the library and report the corrupt ones,
+    action "quarantine" moves them aside and "requeue" also downloads them again"""
 
-        # ----- print
-        uc.wresize(print_win, search_class.rows - 2, search_class.columns)
-        uc.wclear(print_win)
+    folder = library_folder()
+    width = shutil.get_terminal_size().columns - 1
+    shown = [0.0]
 
-        for i, entry in enumerate(search_class.print_list):
-            if len(entry[0]) <= columns_len - 2:
-                title = entry[0]
-            else:
-                title = entry[0][: columns_len - 5] + "..."
-            if i == search_class.index:
-                pre = "-"
-            else:
-                pre = " "
-            uc.mvwaddwstr(print_win, i, 0, f"{pre} {title}")
+    def progress(checked: int, total: int) -> None:
+        now = time.perf_counter()
+        if now - shown[0] > 0.2 or checked == total:
+            shown[0] = now
+            print(f"\r\033[K  checked {checked} / {total}"[:width], end="", flush=True)
+
+    start = time.perf_counter()
+    corrupt = []
+    for path, problem in scrub(folder, progress, lambda: ENV.stop):
+        print(f"\r\033[K- {os.path.relpath(path, folder)}: {problem}")
+        corrupt.append(path)
+    if ENV.stop:
+        return
+    print(f"\r\033[K{len(corrupt)} corrupt archives, checked in {time.perf_counter() - start:.1f} s")
+    if not corrupt or action == "report":
+        return
+
+    tracked = {name: (url, website) for url, website, name in LIBRARY.mangas()}
+    chapters: dict[str, set[str]] = {}  # manga name -> chapters quarantined
+    for path in corrupt:
+        quarantine(path, folder)
+        name = os.path.basename(os.path.dirname(path))
+        chapter = os.path.basename(path)[: -len(".cbz")]
+        chapters.setdefault(name, set()).add(chapter)
+        if name in tracked:
+            LIBRARY.record({"url": tracked[name][0]}, chapter, FAILED)
+    print(f"Moved to {os.path.join(folder, QUARANTINE)}")
+    if action != "requeue":
+        return
+
+    sources = []
+    for name, names in chapters.items():
+        if name not in tracked:
+            print(f"- {name}: not in the library, download it again with -u")
+            continue
+        url, website = tracked[name]
+        sources.append((name, partial(fetch_manga, website, url, names)))
+    print("Press CTRL+C to quit.")
+    download_batch(sources)
+
+
+def validate_job(url: str, chapters: str) -> str:
+    """return why a job cannot be queued, "" if it can"""
+
+    if not get_manga_website(url):
+        return "Manga website not identified"
+    try:
+        Selection(chapters)
+    except ValueError as excp:
+        return str(excp)
+    return ""
+
+
+class Daemon:
+    """process downloading the jobs of the persistent queue until interrupted
+    the adapters, the sessions and the scheduler stay warm between the jobs,
+    which are added, prioritised, paused and cancelled through the api"""
+
+    def __init__(self, address: str, max_jobs: int) -> None:
+        from downloader.jobs import JOBS
+
+        self.jobs: JobQueue = JOBS
+        self.address = address
+        self.max_jobs = max_jobs  # mangas downloading at the same time
+        self.wake = threading.Event()
+        self.running: dict[int, threading.Event] = {}  # job id -> cancel
+        self.lock = threading.Lock()
+
+    def serve(self) -> None:
+        """run the jobs as they come"""
+
+        from downloader.api import Api, start_api
+
+        recovered = self.jobs.recover()
+        server = start_api(self.address, Api(self.jobs, self.changed, validate_job, self.status))
+        print(f"Listening on {self.address}, {recovered} jobs resumed. Press CTRL+C to quit.")
+
+        progress_thread = threading.Thread(target=self.progress, daemon=True)
+        progress_thread.start()
+        scheduler = create_scheduler()
+        pool = ThreadPoolExecutor(ENV.workers, "manga")
+
+        while not ENV.stop:
+            with self.lock:
+                idle = not self.running
+                free = len(self.running) < self.max_jobs
+                # a job paused and resumed is claimed again once its chapters
+                # of the previous run are all reported
+                draining = tuple(self.running)
+            job = self.jobs.claim(draining) if free else None
+            if job is None:
+                if idle:
+                    # the records of the finished jobs are not kept forever
+                    METRICS.reset()
+                self.wake.wait(1)
+                self.wake.clear()
+                continue
+
+            cancel = threading.Event()
+            with self.lock:
+                self.running[job["id"]] = cancel
+            pool.submit(self.start, scheduler, job, cancel)
+
+        server.shutdown()
+        server.server_close()
+        if "/" in self.address and os.path.exists(self.address):
+            os.remove(self.address)
+        pool.shutdown(wait=True, cancel_futures=True)
+        scheduler.join()
+        ENV.print_queue.put(None)
+        progress_thread.join()
+        self.jobs.close()
+
+    def start(
+        self, scheduler: "PageScheduler | AsyncEngine", job: dict, cancel: threading.Event
+    ) -> None:
+        """create the manga of a job and queue its chapters"""
+
+        try:
+            manga = fetch_manga(get_manga_website(job["url"]), job["url"])
+            queued = queue_manga(
+                scheduler, manga, Selection(job["chapters"]), cancel, group=job["id"]
+            )
+        except Exception as excp:
+            self.finish(job["id"], FAILED, f"error type: {excp}")
+            return
+        if not queued:
+            self.finish(job["id"], DONE)
+
+    def finish(self, job_id: int, status: str, error: str = "") -> None:
+        """end a job, a job paused or cancelled meanwhile keeps that status"""
 
-        uc.wrefresh(print_win)
-        # ----- end print
+        with self.lock:
+            self.running.pop(job_id, None)
+        self.jobs.finish(job_id, status, error)
+        self.wake.set()
+
+    def progress(self) -> None:
+        """follow the chapters of the running jobs, in place of the printer"""
+
+        # the chapters of the daemon are reported under the id of their job
+        progress: dict[int, list] = {}  # job id -> [done, total, failed]
+
+        while True:
+            token = ENV.print_queue.get()
+            if token is None or token == 1:
+                return
+
+            kind, job_id, value = token
+            if kind == "message":
+                print(job_id)
+                continue
+            if kind == "manga":
+                progress[job_id] = [0, value, []]
+                continue
+
+            entry = progress[job_id]
+            entry[0] += 1
+            if value:
+                entry[2].append(value)
+            self.jobs.progress(job_id, entry[0], entry[1])
+            if entry[0] == entry[1]:
+                del progress[job_id]
+                self.finish(job_id, FAILED if entry[2] else DONE, "; ".join(entry[2]))
+
+    def changed(self, job_id: int, action: str) -> None:
+        """give up the chapters of a job paused or cancelled, wake up the queue"""
+
+        if action in ("pause", "cancel"):
+            with self.lock:
+                cancel = self.running.get(job_id)
+            if cancel is not None:
+                cancel.set()
+        self.wake.set()
+
+    def status(self) -> dict:
+        """return the state of the daemon"""
+
+        with self.lock:
+            running = sorted(self.running)
+        return {
+            "jobs": self.jobs.counts(),
+            "running": running,
+            "limits": CONCURRENCY.limits(),
+            "bandwidth": BANDWIDTH.describe(),
+            "summary": METRICS.summary(),
+        }
+
+
+def fit(text: str, width: int) -> str:
+    """return text cut to width characters"""
+
+    return text if len(text) <= width else text[: max(width - 3, 0)] + "..."
+
+
+def search_printer(search_class: SearchClass) -> None:
+    """draw the search interface whenever its state changes
+    the rows are compared with the ones on the screen and only the changed ones
+    are rewritten, so a key costs a few rows whatever the number of results"""
+
+    while True:
+        search_class.redraw.wait()
+        search_class.redraw.clear()
+
+        rows, columns = search_class.rows, search_class.columns
+        with search_class.lock:
+            if search_class.closed:
+                return
+            visible = search_class.results[search_class.top : search_class.top + rows - 2]
+            cursor = search_class.index - search_class.top
+            count = f"{search_class.index + 1 if visible else 0} / {len(search_class.results)}"
+            if search_class.wanted:
+                count += " searching.."
+            elif not search_class.complete:
+                count += "+"
+            word = search_class.word
+
+        if (rows, columns) != search_class.size:
+            search_class.size = (rows, columns)
+            uc.wresize(search_class.window, rows, columns)
+            uc.werase(search_class.window)
+            search_class.drawn = []
+
+        # the last column is left empty, curses cannot write past it
+        width = columns - 1
+        lines = [fit(f"Press TAB to exit.  {count}", width), fit(f"| {word}", width)]
+        for i, entry in enumerate(visible):
+            lines.append(f"{'-' if i == cursor else ' '} {fit(entry[0], width - 2)}")
+        lines += [""] * (rows - len(lines))
+
+        for row, line in enumerate(lines[:rows]):
+            if row < len(search_class.drawn) and search_class.drawn[row] == line:
+                continue
+            uc.mvwaddwstr(search_class.window, row, 0, line)
+            uc.wclrtoeol(search_class.window)
+        search_class.drawn = lines
+        uc.wrefresh(search_class.window)
+
+
+def search_fetcher(search_class: SearchClass) -> None:
+    """ask the adapter for the results wanted, the latest word only"""
+
+    while True:
+        search_class.fetch.wait()
+        search_class.fetch.clear()
+        with search_class.lock:
+            if search_class.closed:
+                return
+            word, wanted = search_class.word, search_class.wanted
+        if not wanted:
+            continue
+
+        results = search_class.adapter.print_list(
+            word, wanted, cancelled=lambda: search_class.word != word
+        )
+
+        with search_class.lock:
+            if search_class.word != word:
+                # superseded, the newer word is already flagged
+                continue
+            search_class.results = results
+            search_class.complete = len(results) < wanted
+            search_class.index = min(search_class.index, max(len(results) - 1, 0))
+            if search_class.wanted <= wanted:
+                search_class.wanted = 0
+        search_class.redraw.set()
+        # the cursor may have reached the end while loading
+        search_class.move(0)
 
 
 def search(stdscr: ctypes.c_void_p, manga_website: str) -> dict[str, str | list[dict]]:
@@ -306,60 +835,86 @@ def search(stdscr: ctypes.c_void_p, manga_website: str) -> dict[str, str | list[
     ENV.get_manga[manga_website].load_database()
 
     search_class = SearchClass(manga_website)
-
-    uc.mvaddstr(0, 0, "Press TAB to exit.")
-    uc.mvaddch(1, 0, "|")
+    moves = {"KEY_UP": -1, "KEY_DOWN": 1}
 
     while True:
         button = uc.getkey()
 
-        if button == "KEY_UP":
-            if len(search_class.print_list) > 1:
-                uc.mvaddch(2 + search_class.index, 0, " ")
-                search_class.index -= 1
-                uc.mvaddch(2 + search_class.index, 0, "-")
-        elif button == "KEY_DOWN":
-            if len(search_class.print_list) > 1:
-                uc.mvaddch(2 + search_class.index, 0, " ")
-                search_class.index += 1
-                uc.mvaddch(2 + search_class.index, 0, "-")
+        if button in moves:
+            search_class.move(moves[button])
+        elif button == "KEY_PPAGE":
+            search_class.move(-search_class.page)
+        elif button == "KEY_NPAGE":
+            search_class.move(search_class.page)
+        elif button == "KEY_HOME":
+            search_class.move(-len(search_class.results))
+        elif button == "KEY_END":
+            search_class.move(len(search_class.results))
+        elif button == "KEY_RESIZE":
+            # stdscr is resized and marked as changed, refresh it before the window
+            uc.refresh()
+            search_class.redraw.set()
         elif button == "^I":
             output = {}
             break
         elif button == "^J":
-            output = ENV.get_manga[manga_website].create_manga(search_class.url_manga)
+            output = search_class.adapter.create_manga(search_class.url_manga)
             break
-        if button == "KEY_BACKSPACE":
+        elif button == "KEY_BACKSPACE":
             if search_class.word:
-                uc.mvaddch(1, 1 + len(search_class.word), " ")
-                search_class.word = search_class.word[:-1]
-                if search_class.queue.empty():
-                    search_class.queue_put()
+                search_class.type(search_class.word[:-1])
         elif len(button) == 1:
-            uc.mvadd_wch(1, 2 + len(search_class.word), button)
-            search_class.word += button
-            if search_class.queue.empty():
-                search_class.queue_put()
+            search_class.type(search_class.word + button)
 
     search_class.quit()
 
     return output
 
 
-def main(urls: list[str]) -> None:
-    """main function"""
+def ask_selection(manga: dict[str, str | list[dict]]) -> Selection:
+    """ask which chapters of manga to download"""
+
+    chapters = manga["list_chapters"]
+    numbers = [chapter["number"] for chapter in chapters if chapter.get("number") is not None]
+    if numbers:
+        print(f"{len(chapters)} chapters, from {min(numbers):g} to {max(numbers):g}")
+
+    while True:
+        expression = input("Chapters, e.g. 1-10, latest 5, new, vol 2 [all]: ")
+        try:
+            return Selection(expression)
+        except ValueError as excp:
+            print(excp)
+
+
+def main(urls: list[str], update: bool = False, daemon: str = "", verify: str = "") -> None:
+    """main function, daemon is the address of the api when run as a daemon,
+    verify the action on the corrupt archives when the library is checked"""
 
     ENV.set_main_process()
+    SESSIONS.configure(pool_maxsize=ENV.max_workers)
+    CONCURRENCY.configure(initial=ENV.workers, maximum=ENV.max_workers)
+
+    if daemon:
+        Daemon(daemon, ENV.workers).serve()
+
+    elif verify:
+        verify_library(verify)
+
+    elif update:
+        print("Press CTRL+C to quit.")
+        update_library()
 
-    if urls:
+    elif urls:
         print("Press CTRL+C to quit.")
-        for url in urls:
+        sources = []
+        for url in dict.fromkeys(urls):
             manga_website = get_manga_website(url)
             if not manga_website:
                 print("Manga website not identified")
                 continue
-            manga = ENV.get_manga[manga_website].create_manga(url)
-            download_manga(manga)
+            sources.append((url, partial(fetch_manga, manga_website, url)))
+        download_batch(sources)
 
     else:
         search_again = True
@@ -372,10 +927,12 @@ def main(urls: list[str]) -> None:
             index = input("Selection: ")
             if index.isdigit() and 0 <= int(index) < len(manga_selection):
                 manga_website = manga_selection[int(index)]
+                load_curses()
                 manga = uc.wrapper(search, manga_website)
                 if manga:
+                    ENV.selection = ask_selection(manga)
                     print("Press CTRL+C to quit.")
-                    download_manga(manga)
+                    download_batch([(manga["name"], lambda: manga)])
 
             search_again = input(
                 "Do you want to search again? [y/n] "
@@ -390,6 +947,89 @@ if __name__ == "__main__":
         description="yes, yikes, here's another manga downloader..",
     )
     parser.add_argument("-u", "--urls", nargs="+", help="insert links to download")
+    parser.add_argument(
+        "-U",
+        "--update",
+        action="store_true",
+        help="download the new chapters of every manga in the library",
+    )
+    parser.add_argument(
+        "--verify",
+        nargs="?",
+        const="report",
+        choices=("report", "quarantine", "requeue"),
+        help="check the crc of every archive of the library, then report the corrupt"
+        " ones, move them to the quarantine, or also download them again",
+    )
+    parser.add_argument(
+        "-d",
+        "--daemon",
+        action="store_true",
+        help="download the jobs of the persistent queue, see amd_client.py",
+    )
+    parser.add_argument(
+        "--address",
+        default="",
+        help="host:port or unix socket path of the daemon api, 127.0.0.1:8642 by default",
+    )
+    parser.add_argument(
+        "-c",
+        "--chapters",
+        type=Selection,
+        default=Selection(),
+        help='chapters to download, e.g. "1-10", "latest 5", "new", "vol 2", comma separated',
+    )
+    parser.add_argument(
+        "-b",
+        "--bandwidth",
+        type=parse_rate,
+        default=0.0,
+        help='total download rate, e.g. "2M" for 2 MB/s, USR1 and USR2 signals double or halve it',
+    )
+    parser.add_argument(
+        "--host-bandwidth", type=parse_rate, default=0.0, help="download rate of each host"
+    )
+    parser.add_argument(
+        "-r",
+        "--reencode",
+        choices=("webp", "avif", "jxl", "jpg", "png"),
+        help="re-encode the pages of the new chapters, requires Pillow",
+    )
+    parser.add_argument(
+        "-q", "--quality", type=int, default=80, help="quality of the re-encoded pages"
+    )
+    parser.add_argument(
+        "--cpu",
+        choices=("auto", "threads", "processes"),
+        default="auto",
+        help="workers of the cpu bound stages, auto uses threads only without the GIL",
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        choices=("threads", "asyncio"),
+        default="threads",
+        help="download engine, asyncio requires aiohttp",
+    )
+    parser.add_argument(
+        "-t", "--trace", help="append a json line for every request and chapter to TRACE"
+    )
     args = parser.parse_args()  # args.picker contains the modality
 
-    main(args.urls)
+    ENV.engine = args.engine
+    ENV.selection = args.chapters
+    BANDWIDTH.configure(rate=args.bandwidth, host_rate=args.host_bandwidth)
+    CPU.configure(args.cpu)
+    if args.reencode:
+        try:
+            ENV.reencoder = Reencoder(args.reencode, args.quality)
+        except (ImportError, ValueError) as excp:
+            parser.error(str(excp))
+    if args.trace:
+        METRICS.open_trace(args.trace)
+    address = ""
+    if args.daemon:
+        from downloader.api import DEFAULT_ADDRESS
+
+        address = args.address or DEFAULT_ADDRESS
+    main(args.urls, args.update, address, args.verify)
@@ -0,0 +1 @@
+"""benchmarks of another_manga_downloader"""
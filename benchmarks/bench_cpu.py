@@ -0,0 +1,109 @@
+"""benchmark of the cpu bound stages on threads against processes
+run it with a regular and with a free-threaded (3.13t) interpreter to decide
+which build to deploy
+
+run from the root of the repository:
+python -m benchmarks.bench_cpu [--chapters N] [--pages N] [--modes threads processes]"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from zipfile import ZipFile, ZIP_STORED
+from downloader import CpuPool, verify_archive, gil_enabled
+from manga_websites.extract import extract
+from benchmarks.bench_extract import read_fixture, scale_directory
+
+MARKERS = {
+    "mangalife_manga.html": "vm.Chapters = ",
+    "mangalife_page.html": "vm.CurChapter = ",
+    "batoto_chapter.html": "const imgHttps = ",
+    "mangalife_search.html": "vm.Directory = ",
+}
+
+
+def parse(case: tuple[str, str]) -> int:
+    """parse the embedded data of a page, return the number of values found"""
+
+    marker, html = case
+    value = extract(html, marker)
+    return len(value) if value is not None else 0
+
+
+def build_chapters(folder: str, chapters: int, pages: int, page_size: int) -> list[str]:
+    """write chapters archives of random pages in folder and return their paths"""
+
+    page = os.urandom(page_size)
+    paths = []
+    for number in range(chapters):
+        path = os.path.join(folder, f"{number:05d}.cbz")
+        with ZipFile(path, "w", ZIP_STORED) as zip_file:
+            sizes = {}
+            for page_number in range(pages):
+                # a different prefix for every page, so that no crc is the same
+                data = number.to_bytes(4, "big") + page_number.to_bytes(4, "big") + page
+                zip_file.writestr(f"{page_number:03d}.png", data)
+                sizes[f"{page_number:03d}"] = len(data)
+            zip_file.comment = json.dumps(sizes).encode()
+        paths.append(path)
+    return paths
+
+
+def measure(pool: CpuPool, function, items: list) -> float:
+    """return the seconds taken to map function over items on pool"""
+
+    start = time.perf_counter()
+    results = pool.map(function, items)
+    elapsed = time.perf_counter() - start
+    assert all(results), function.__name__
+    return elapsed
+
+
+def main(args: argparse.Namespace) -> None:
+    """run every stage on every mode and print a table"""
+
+    cases = []
+    for name, marker in MARKERS.items():
+        html = read_fixture(name)
+        if name == "mangalife_search.html":
+            html = scale_directory(html, args.scale)
+            cases += [(marker, html)] * max(args.chapters // 100, 1)
+        else:
+            cases += [(marker, html)] * args.chapters
+
+    folder = tempfile.mkdtemp(prefix="amd-bench-cpu-")
+    try:
+        paths = build_chapters(folder, args.chapters, args.pages, args.page_size)
+
+        print(f"GIL {'enabled' if gil_enabled() else 'disabled'}, {args.workers} workers")
+        print(f"{'mode':<11}{'parse s':>9}{'verify s':>10}{'total s':>9}")
+        totals = {}
+        for mode in args.modes:
+            pool = CpuPool(mode, args.workers)
+            # the workers are started before measuring
+            pool.map(parse, cases[:args.workers])
+            parse_time = measure(pool, parse, cases)
+            verify_time = measure(pool, verify_archive, paths)
+            pool.close()
+            totals[mode] = parse_time + verify_time
+            print(f"{mode:<11}{parse_time:>9.3f}{verify_time:>10.3f}{totals[mode]:>9.3f}")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    if "threads" in totals and "processes" in totals:
+        print(f"threads are {totals['processes'] / totals['threads']:.2f}x the processes")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bench_cpu")
+    parser.add_argument("--chapters", type=int, default=400, help="chapters of the set")
+    parser.add_argument("--pages", type=int, default=20, help="pages per chapter")
+    parser.add_argument("--page-size", type=int, default=200_000, help="bytes per page")
+    parser.add_argument("--scale", type=int, default=20, help="vm.Directory repetitions")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--modes", nargs="+", choices=("threads", "processes"), default=["threads", "processes"]
+    )
+    main(parser.parse_args())
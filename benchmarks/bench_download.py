@@ -0,0 +1,136 @@
+"""end-to-end benchmark of the downloader against the local stand-in server
+the server runs in a separate process, so that the resources reported are the
+ones of the downloader alone
+
+run from the root of the repository:
+python -m benchmarks.bench_download [--site mangalife] [--engine threads] ..."""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+from zipfile import ZipFile
+from benchmarks.server import add_arguments
+from downloader import parse_rate
+
+
+def start_server(args: argparse.Namespace) -> tuple[subprocess.Popen, str]:
+    """start the stand-in server process and return it with its url"""
+
+    command = [sys.executable, "-m", "benchmarks.server"]
+    for option in ("mangas", "chapters", "pages", "page_size", "latency", "bandwidth", "error_rate"):
+        command += ["--" + option.replace("_", "-"), str(getattr(args, option))]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    assert process.stdout is not None
+    return process, process.stdout.readline().strip()
+
+
+def library_stats(folder: str) -> tuple[int, int, int]:
+    """return the number of archives, pages and page bytes inside folder"""
+
+    chapters = pages = size = 0
+    for root, _, files in os.walk(folder):
+        for file_name in files:
+            if not file_name.endswith(".cbz"):
+                continue
+            chapters += 1
+            with ZipFile(os.path.join(root, file_name)) as zip_file:
+                for info in zip_file.infolist():
+                    pages += 1
+                    size += info.file_size
+    return chapters, pages, size
+
+
+def run(args: argparse.Namespace) -> dict:
+    """download the library of the stand-in server and return the measures"""
+
+    process, url = start_server(args)
+    home = tempfile.mkdtemp(prefix="amd-bench-")
+    os.environ["HOME"] = home
+    os.environ["XDG_CACHE_HOME"] = os.path.join(home, ".cache")
+
+    try:
+        # imported here, so that ENV is built with the benchmark environment
+        import another_manga_downloader as amd
+        from manga_websites import WEBSITES
+
+        # distinct hosts, so that get_manga_website tells the two sites apart
+        batoto_page = url.replace("127.0.0.1", "localhost")
+        WEBSITES["mangalife"] = WEBSITES["mangalife"][:2] + (url,)
+        WEBSITES["batoto"] = WEBSITES["batoto"][:2] + (batoto_page,)
+        amd.ENV.engine = args.engine
+        amd.ENV.workers = args.workers
+        amd.ENV.max_workers = max(args.max_workers, args.workers)
+        amd.BANDWIDTH.configure(rate=args.limit)
+
+        if args.site == "mangalife":
+            urls = [f"{url}/manga/Bench-Manga-{number}" for number in range(args.mangas)]
+        else:
+            urls = [f"{batoto_page}/series/{number}" for number in range(args.mangas)]
+
+        usage_start = resource.getrusage(resource.RUSAGE_SELF)
+        start = time.perf_counter()
+        amd.main(urls)
+        elapsed = time.perf_counter() - start
+        usage_end = resource.getrusage(resource.RUSAGE_SELF)
+
+        # a second pass over the library, where no chapter is new
+        update_elapsed = 0.0
+        if args.update:
+            update_start = time.perf_counter()
+            amd.main([], update=True)
+            update_elapsed = time.perf_counter() - update_start
+
+        chapters, pages, size = library_stats(os.path.join(home, "Mangas"))
+    finally:
+        process.terminate()
+        process.wait()
+        if not args.keep:
+            shutil.rmtree(home, ignore_errors=True)
+
+    cpu = (usage_end.ru_utime - usage_start.ru_utime) + (
+        usage_end.ru_stime - usage_start.ru_stime
+    )
+    return {
+        "site": args.site,
+        "engine": args.engine,
+        "workers": args.workers,
+        "max workers": args.max_workers,
+        "seconds": round(elapsed, 3),
+        "chapters": chapters,
+        "pages": pages,
+        "chapters/s": round(chapters / elapsed, 2),
+        "pages/s": round(pages / elapsed, 2),
+        "MB/s": round(size / elapsed / 1e6, 2),
+        "peak RSS MB": round(usage_end.ru_maxrss / 1024, 1),
+        "CPU s": round(cpu, 2),
+        "CPU %": round(100 * cpu / elapsed, 1),
+        "update seconds": round(update_elapsed, 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bench_download")
+    parser.add_argument("--site", choices=("mangalife", "batoto"), default="mangalife")
+    parser.add_argument("--engine", choices=("threads", "asyncio"), default="threads")
+    parser.add_argument("--workers", type=int, default=8, help="starting requests in flight per host")
+    parser.add_argument("--max-workers", type=int, default=32, help="upper bound of the adaptive limits")
+    parser.add_argument("--limit", type=parse_rate, default=0.0, help="downloader bandwidth, e.g. 5M")
+    parser.add_argument("--json", action="store_true", help="print a json line")
+    parser.add_argument("--update", action="store_true", help="time an update of the library afterwards")
+    parser.add_argument("--keep", action="store_true", help="keep the downloaded files")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print()
+        for key, value in report.items():
+            print(f"{key:<16}{value}")
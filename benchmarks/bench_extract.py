@@ -0,0 +1,149 @@
+"""micro-benchmarks of the extraction of the javascript data embedded in the html
+compare the previous regex + ast.literal_eval parsing with manga_websites.extract
+
+run from the root of the repository:
+python -m benchmarks.bench_extract [--scale N] [--repeat N]"""
+
+import os
+import re
+import ast
+import json
+import time
+import argparse
+import tracemalloc
+from typing import Any, Callable
+from manga_websites.extract import extract, iter_array
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def read_fixture(name: str) -> str:
+    """return the content of a saved html fixture"""
+
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as fixture_file:
+        return fixture_file.read()
+
+
+def scale_directory(html: str, scale: int) -> str:
+    """repeat the entries of vm.Directory scale times"""
+
+    entries = extract(html, "vm.Directory = ")
+    directory = json.dumps(entries * scale, separators=(",", ":"))
+    return re.sub(r"vm.Directory = .*;", lambda _: f"vm.Directory = {directory};", html)
+
+
+# previous implementations
+
+
+def regex_directory(html: str) -> list:
+    """vm.Directory as parsed by the previous Mangalife.load_database"""
+
+    list_mangas = (
+        re.search(r"vm.Directory = (.*);", html)
+        .group(1)
+        .replace("null", "None")
+        .replace("false", "False")
+        .replace("true", "True")
+    )
+    return ast.literal_eval(list_mangas)
+
+
+def regex_chapters(html: str) -> list:
+    """vm.Chapters as parsed by the previous Mangalife.create_manga"""
+
+    return ast.literal_eval(
+        re.search(r"vm.Chapters = (.*?);", html).group(1).replace("null", "None")
+    )
+
+
+def regex_cur_chapter(html: str) -> dict:
+    """vm.CurChapter as parsed by the previous Mangalife.img_generator"""
+
+    return ast.literal_eval(
+        re.search(r"vm.CurChapter = (.*?);", html).group(1).replace("null", "None")
+    )
+
+
+def regex_images(html: str) -> list:
+    """imgHttps as parsed by the previous Batoto.img_generator"""
+
+    return ast.literal_eval(re.search(r"const imgHttps = (.*?);", html).group(1))
+
+
+# measure
+
+
+def measure(function: Callable[[str], Any], html: str, repeat: int) -> tuple[float, int]:
+    """return the best time in ms and the peak memory in KiB of function(html)"""
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(html)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    function(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best * 1000, peak // 1024
+
+
+def main(scale: int, repeat: int) -> None:
+    """run every benchmark and print a table"""
+
+    search_html = scale_directory(read_fixture("mangalife_search.html"), scale)
+    cases = [
+        (
+            "vm.Directory",
+            search_html,
+            regex_directory,
+            lambda html: extract(html, "vm.Directory = "),
+            lambda html: [(entry["i"], entry["s"]) for entry in iter_array(html, "vm.Directory = ")],
+        ),
+        (
+            "vm.Chapters",
+            read_fixture("mangalife_manga.html"),
+            regex_chapters,
+            lambda html: extract(html, "vm.Chapters = "),
+            lambda html: list(iter_array(html, "vm.Chapters = ")),
+        ),
+        (
+            "vm.CurChapter",
+            read_fixture("mangalife_page.html"),
+            regex_cur_chapter,
+            lambda html: extract(html, "vm.CurChapter = "),
+            None,
+        ),
+        (
+            "imgHttps",
+            read_fixture("batoto_chapter.html"),
+            regex_images,
+            lambda html: extract(html, "const imgHttps = "),
+            lambda html: list(iter_array(html, "const imgHttps = ")),
+        ),
+    ]
+
+    print(f"{'data':<14}{'method':<10}{'time ms':>10}{'peak KiB':>10}{'speedup':>9}")
+    for name, html, previous, new, lazy in cases:
+        assert previous(html) == new(html), name
+        base_time, base_memory = measure(previous, html, repeat)
+        print(f"{name:<14}{'regex':<10}{base_time:>10.3f}{base_memory:>10}{1:>9.1f}")
+        for method, function in (("extract", new), ("lazy", lazy)):
+            if function is None:
+                continue
+            run_time, memory = measure(function, html, repeat)
+            print(
+                f"{'':<14}{method:<10}{run_time:>10.3f}{memory:>10}"
+                f"{base_time / run_time:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bench_extract")
+    parser.add_argument("--scale", type=int, default=60, help="vm.Directory repetitions")
+    parser.add_argument("--repeat", type=int, default=5, help="runs for each method")
+    args = parser.parse_args()
+
+    main(args.scale, args.repeat)
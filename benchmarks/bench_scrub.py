@@ -0,0 +1,82 @@
+"""benchmark of the integrity check of a large library, as run by --verify
+a library of generated archives is checked on threads and on processes, with
+a few archives corrupted to make sure that they are all found
+
+run from the root of the repository:
+python -m benchmarks.bench_scrub [--mangas 100] [--chapters 100] [--modes threads processes]"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from downloader import CPU, find_archives, scrub, gil_enabled
+from benchmarks.bench_cpu import build_chapters
+
+
+def build_library(folder: str, args: argparse.Namespace) -> int:
+    """write the library in folder, corrupt args.corrupt archives, return its bytes"""
+
+    for number in range(args.mangas):
+        manga_folder = os.path.join(folder, f"Manga {number}")
+        os.makedirs(manga_folder)
+        build_chapters(manga_folder, args.chapters, args.pages, args.page_size)
+
+    paths = find_archives(folder)
+    step = max(len(paths) // max(args.corrupt, 1), 1)
+    for path in paths[::step][: args.corrupt]:
+        # flip a byte in the middle of the first page
+        with open(path, "r+b") as zip_file:
+            zip_file.seek(64)
+            byte = zip_file.read(1)
+            zip_file.seek(64)
+            zip_file.write(bytes([byte[0] ^ 0xFF]))
+    return sum(os.path.getsize(path) for path in paths)
+
+
+def run(args: argparse.Namespace) -> dict:
+    """build the library and time its check in every mode"""
+
+    folder = tempfile.mkdtemp(prefix="amd-scrub-")
+    try:
+        size = build_library(folder, args)
+        archives = args.mangas * args.chapters
+        report = {
+            "archives": archives,
+            "MB": round(size / 1e6, 1),
+            "GIL": "enabled" if gil_enabled() else "disabled",
+        }
+        for mode in args.modes:
+            CPU.configure(mode, args.workers)
+            start = time.perf_counter()
+            found = sum(1 for _ in scrub(folder))
+            elapsed = time.perf_counter() - start
+            CPU.close()
+            assert found == args.corrupt, f"{found} corrupt archives found"
+            report[f"{mode} s"] = round(elapsed, 2)
+            report[f"{mode} archives/s"] = round(archives / elapsed)
+            report[f"{mode} MB/s"] = round(size / elapsed / 1e6, 1)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bench_scrub")
+    parser.add_argument("--mangas", type=int, default=100)
+    parser.add_argument("--chapters", type=int, default=100, help="archives of each manga")
+    parser.add_argument("--pages", type=int, default=8)
+    parser.add_argument("--page-size", type=int, default=4096)
+    parser.add_argument("--corrupt", type=int, default=10, help="archives corrupted")
+    parser.add_argument("--workers", type=int, default=0, help="0 for one per core")
+    parser.add_argument("--modes", nargs="+", default=["threads", "processes"])
+    parser.add_argument("--json", action="store_true", help="print a json line")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report))
+    else:
+        for key, value in report.items():
+            print(f"{key:<22}{value}")
@@ -0,0 +1,112 @@
+"""startup time of the downloader, interpreted and compiled by compile.sh
+every measure is a fresh process, the best and the median of the runs are
+reported with the heavy modules each command ended up importing
+
+run from the root of the repository:
+python -m benchmarks.bench_startup [--runs 20] [--build] [--binary PATH]"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+# imported on demand by the downloader, none of them is needed to start
+HEAVY = (
+    "requests",
+    "aiohttp",
+    "unicurses",
+    "PIL",
+    "manga_websites.mangalife",
+    "manga_websites.batoto",
+    "downloader.async_engine",
+    "downloader.jobs",
+    "downloader.api",
+    "asyncio",
+    "http.server",
+)
+
+# output of compile.sh, for nuitka and pyinstaller
+BINARIES = ("another_manga_downloader.bin", os.path.join("dist", "another_manga_downloader"))
+
+
+def timed(command: list[str], runs: int, env: dict[str, str]) -> dict[str, float]:
+    """run command runs times and return the best and the median wall time in ms"""
+
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return {"best ms": round(min(times), 1), "median ms": round(statistics.median(times), 1)}
+
+
+def loaded_modules(env: dict[str, str]) -> list[str]:
+    """return the heavy modules loaded by importing the entry script"""
+
+    code = (
+        "import sys, json, another_manga_downloader;"
+        f"print(json.dumps([name for name in {HEAVY!r} if name in sys.modules]))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(output.stdout)
+
+
+def find_binary(path: str) -> str:
+    """return the compiled executable, "" if it has not been built"""
+
+    for candidate in (path,) if path else BINARIES:
+        if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+            return candidate
+    return ""
+
+
+def run(args: argparse.Namespace) -> dict:
+    """measure every command and return the report"""
+
+    home = tempfile.mkdtemp(prefix="amd-startup-")
+    # the downloader creates its library files in the home folder
+    env = dict(os.environ, HOME=home, XDG_CACHE_HOME=os.path.join(home, ".cache"))
+    report = {}
+    try:
+        report["python"] = timed([sys.executable, "-c", "pass"], args.runs, env)
+        report["import"] = timed(
+            [sys.executable, "-c", "import another_manga_downloader"], args.runs, env
+        )
+        report["--help"] = timed(
+            [sys.executable, "another_manga_downloader.py", "--help"], args.runs, env
+        )
+        report["loaded"] = loaded_modules(env)
+
+        if args.build:
+            subprocess.run(["bash", "compile.sh"], check=True)
+        binary = find_binary(args.binary)
+        if binary:
+            report["compiled --help"] = timed([os.path.abspath(binary), "--help"], args.runs, env)
+        else:
+            report["compiled --help"] = "not built, run compile.sh or pass --build"
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="bench_startup")
+    parser.add_argument("--runs", type=int, default=20, help="processes started for each measure")
+    parser.add_argument("--build", action="store_true", help="run compile.sh first")
+    parser.add_argument("--binary", default="", help="compiled executable, found by default")
+    parser.add_argument("--json", action="store_true", help="print a json line")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report))
+    else:
+        for key, value in report.items():
+            print(f"{key:<16}{value}")
@@ -0,0 +1,234 @@
+"""local stand-in for the manga websites, used by the benchmarks
+it mimics the pages of mangalife and batoto that the adapters parse, and serves
+deterministic images with configurable latency, bandwidth and error rate
+
+run from the root of the repository:
+python -m benchmarks.server [--port N] [--mangas N] [--chapters N] [--pages N] ..."""
+
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class ServerConfig:
+    """shape of the served library and of the network"""
+
+    def __init__(
+        self,
+        mangas: int = 2,
+        chapters: int = 20,
+        pages: int = 15,
+        page_size: int = 200_000,
+        latency: float = 0.0,
+        bandwidth: float = 0.0,
+        error_rate: float = 0.0,
+    ) -> None:
+        self.mangas = mangas
+        self.chapters = chapters
+        self.pages = pages
+        self.page_size = page_size
+        self.latency = latency  # seconds before each response
+        self.bandwidth = bandwidth  # bytes per second of each response, 0 unlimited
+        self.error_rate = error_rate  # share of responses replaced by a 503
+
+    def manga_names(self) -> list[str]:
+        """return the names of the served mangas"""
+
+        return [f"Bench-Manga-{number}" for number in range(self.mangas)]
+
+
+def page_bytes(path: str, size: int) -> bytes:
+    """return deterministic image bytes for path"""
+
+    seed = path.encode()
+    block = (seed * (1024 // len(seed) + 1))[:1024]
+    return b"\x89PNG\r\n\x1a\n" + (block * (size // 1024 + 1))[: max(size - 8, 0)]
+
+
+class MangaHandler(BaseHTTPRequestHandler):
+    """request handler of the stand-in websites"""
+
+    protocol_version = "HTTP/1.1"
+    config = ServerConfig()
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        """route the request to the mangalife or batoto layout"""
+
+        config = self.config
+        if config.latency:
+            time.sleep(config.latency)
+        path = self.path.split("?", 1)[0]
+        # only the chapter downloads fail, they are the ones being retried
+        downloading = "/read-online/" in path or path.startswith(("/chapter/", "/images/")) or path.endswith(".png")
+        if downloading and config.error_rate and random.random() < config.error_rate:
+            self.send_body(b"unavailable", "text/plain", status=503)
+            return
+
+        for pattern, route in (
+            (r"/search/", self.mangalife_search),
+            (r"/manga/([^/]+)", self.mangalife_manga),
+            (r"/read-online/(.+)-chapter-([\d.]+)(?:-index-(\d))?-page-1\.html", self.mangalife_page),
+            (r"/manga/([^/]+)/(\d+)-(\d+)\.png", self.image),
+            (r"/search", self.batoto_search),
+            (r"/series/(\d+)", self.batoto_series),
+            (r"/chapter/(\d+)-(\d+)", self.batoto_chapter),
+            (r"/images/(\d+)/(\d+)/(\d+)\.png", self.image),
+        ):
+            match = re.fullmatch(pattern, path)
+            if match:
+                route(*match.groups())
+                return
+        self.send_body(b"<title>404 Page Not Found</title>", "text/html", status=404)
+
+    def send_body(self, body: bytes, content_type: str, status: int = 200) -> None:
+        """send a response, throttled to the configured bandwidth"""
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        bandwidth = self.config.bandwidth
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+        chunk_size = max(int(bandwidth / 20), 1024)
+        for start in range(0, len(body), chunk_size):
+            self.wfile.write(body[start : start + chunk_size])
+            time.sleep(chunk_size / bandwidth)
+
+    def send_html(self, html: str) -> None:
+        """send an html page"""
+
+        self.send_body(html.encode(), "text/html; charset=utf-8")
+
+    # mangalife
+
+    def mangalife_search(self) -> None:
+        """page containing vm.Directory"""
+
+        directory = [{"i": name, "s": name.replace("-", " ")} for name in self.config.manga_names()]
+        self.send_html(f"<script>\n\tvm.Directory = {json.dumps(directory)};\n</script>")
+
+    def mangalife_manga(self, name: str) -> None:
+        """page of a manga containing vm.Chapters"""
+
+        chapters = [
+            {"Chapter": f"1{number:04d}0", "Type": "Chapter", "ChapterName": None}
+            for number in range(self.config.chapters, 0, -1)
+        ]
+        self.send_html(
+            f"<title>{name.replace('-', ' ')} | MangaLife</title>\n"
+            f"<script>\n\tvm.Chapters = {json.dumps(chapters)};\n</script>"
+        )
+
+    def mangalife_page(self, name: str, chapter: str, index: str | None) -> None:
+        """first reader page of a chapter containing vm.CurChapter"""
+
+        cur_chapter = {
+            "Chapter": f"{index or 1}{int(chapter):04d}0",
+            "Page": str(self.config.pages),
+            "Directory": "",
+        }
+        self.send_html(
+            f"<title>{name} | MangaLife</title>\n<script>\n"
+            f'\tvm.CurPathName = "{self.headers["Host"]}";\n'
+            f"\tvm.CurChapter = {json.dumps(cur_chapter)};\n</script>"
+        )
+
+    # batoto
+
+    def batoto_search(self) -> None:
+        """search results of batoto"""
+
+        items = "".join(
+            f'<a class="item-title" href="/series/{number}" >{name}</a>\n'
+            for number, name in enumerate(self.config.manga_names())
+        )
+        self.send_html(items)
+
+    def batoto_series(self, series: str) -> None:
+        """page of a manga with the list of chapters"""
+
+        chapters = "".join(
+            f'<a class="chapt" href="/chapter/{series}-{number}" >\n<b>Chapter {number}</b>\n'
+            for number in range(self.config.chapters, 0, -1)
+        )
+        self.send_html(f"<title>Bench Manga {series} Manga</title>\n{chapters}")
+
+    def batoto_chapter(self, series: str, chapter: str) -> None:
+        """reader page of a chapter containing imgHttps"""
+
+        host = f"http://{self.headers['Host']}"
+        images = [
+            f"{host}/images/{series}/{chapter}/{page}.png"
+            for page in range(self.config.pages)
+        ]
+        self.send_html(f"<script>\n  const imgHttps = {json.dumps(images)};\n</script>")
+
+    # images
+
+    def image(self, *groups: str) -> None:
+        """deterministic image of the configured size"""
+
+        self.send_body(page_bytes(self.path, self.config.page_size), "image/png")
+
+
+def start_server(config: ServerConfig, port: int = 0) -> ThreadingHTTPServer:
+    """start the stand-in server in a daemon thread and return it"""
+
+    handler = type("ConfiguredHandler", (MangaHandler,), {"config": config})
+    # the default backlog of 5 drops connections under heavy concurrency
+    server_class = type("Server", (ThreadingHTTPServer,), {"request_queue_size": 1024})
+    server = server_class(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """add the options of ServerConfig to parser"""
+
+    parser.add_argument("--mangas", type=int, default=2, help="number of mangas")
+    parser.add_argument("--chapters", type=int, default=20, help="chapters per manga")
+    parser.add_argument("--pages", type=int, default=15, help="pages per chapter")
+    parser.add_argument("--page-size", type=int, default=200_000, help="bytes per page")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per response")
+    parser.add_argument("--bandwidth", type=float, default=0.0, help="bytes/s per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 503s on the chapter downloads")
+
+
+def config_from_args(args: argparse.Namespace) -> ServerConfig:
+    """return the ServerConfig described by the parsed arguments"""
+
+    return ServerConfig(
+        mangas=args.mangas,
+        chapters=args.chapters,
+        pages=args.pages,
+        page_size=args.page_size,
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+        error_rate=args.error_rate,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="server")
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_server(config_from_args(args), args.port)
+    print(f"http://127.0.0.1:{server.server_port}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        sys.exit(0)
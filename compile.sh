@@ -7,12 +7,16 @@ fi
 
 installed_packages=$(pip list)
 
+# the adapters are imported by name on first use, which the compilers cannot
+# follow, their modules are listed from the table of manga_websites/__init__.py
+adapters=$(python -c "from manga_websites import WEBSITES; print(*(f'manga_websites.{module}' for module, _, _ in WEBSITES.values()))")
+
 if echo "$installed_packages" | grep "Nuitka"; then
 	echo "Compiling using nuitka"
-	nuitka --onefile another_manga_downloader.py
+	nuitka --onefile $(printf -- "--include-module=%s " $adapters) another_manga_downloader.py
 elif echo "$installed_packages" | grep "pyinstaller"; then
 	echo "Compiling using pyinstaller"
-	pyinstaller --onefile another_manga_downloader.py
+	pyinstaller --onefile $(printf -- "--hidden-import=%s " $adapters) another_manga_downloader.py
 else
 	echo "Error: neither nuitka nor pyinstaller are installed via pip"
 fi
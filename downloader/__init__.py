@@ -0,0 +1,37 @@
+"""collection of tools used to download and archive the chapters"""
+
+from importlib import import_module
+from .scheduler import ChapterJob, PageScheduler
+from .sessions import SessionPool, SESSIONS
+from .archive import ChapterArchive, check_archive, verify_archive, archive_problem
+from .resume import ChapterManifest
+from .retry import RetryPolicy
+from .metrics import Metrics, METRICS
+from .concurrency import ConcurrencyController, CONCURRENCY
+from .bandwidth import BandwidthLimiter, BANDWIDTH, parse_rate, format_rate
+from .library import Library, LIBRARY, DONE, FAILED, library_folder
+from .parallel import CpuPool, CPU, gil_enabled
+from .images import Reencoder, image_format
+from .scrub import scrub, quarantine, find_archives, QUARANTINE
+
+# modules only needed by the asyncio engine and the daemon, which import asyncio
+# and http.server, sqlite3 is imported anyway by the library: name -> module
+LAZY = {
+    "AsyncEngine": "async_engine",
+    "JobQueue": "jobs",
+    "JOBS": "jobs",
+    "QUEUED": "jobs",
+    "RUNNING": "jobs",
+    "PAUSED": "jobs",
+    "CANCELLED": "jobs",
+    "Api": "api",
+    "start_api": "api",
+    "DEFAULT_ADDRESS": "api",
+}
+
+
+def __getattr__(name: str) -> object:
+    # the lazy names stay importable, e.g. from downloader import AsyncEngine
+    if name in LAZY:
+        return getattr(import_module(f".{LAZY[name]}", __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,160 @@
+"""local http api of the daemon, on a port of localhost or on a unix socket"""
+
+import os
+import re
+import json
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+from .jobs import JobQueue, QUEUED, RUNNING, PAUSED, FAILED, CANCELLED
+from .bandwidth import BANDWIDTH, parse_rate
+
+DEFAULT_ADDRESS = "127.0.0.1:8642"
+
+# action -> (new status, statuses it applies to)
+_TRANSITIONS = {
+    "pause": (PAUSED, (QUEUED, RUNNING)),
+    "resume": (QUEUED, (PAUSED, FAILED, CANCELLED)),
+    "cancel": (CANCELLED, (QUEUED, PAUSED, RUNNING)),
+}
+
+
+def split_address(address: str) -> tuple[str, int]:
+    """return the host and the port of "host:port" or ":port" """
+
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class Api:
+    """requests of the api, answered as (status code, json value)
+    on_change(job_id, action) is called once a job has been added or changed,
+    validate(url, chapters) returns the error of an invalid job, "" if valid"""
+
+    def __init__(
+        self,
+        jobs: JobQueue,
+        on_change: Callable[[int, str], None],
+        validate: Callable[[str, str], str],
+        status: Callable[[], dict],
+    ) -> None:
+        self.jobs = jobs
+        self.on_change = on_change
+        self.validate = validate
+        self.status = status
+
+    def handle(self, method: str, path: str, body: dict) -> tuple[int, dict | list]:
+        """answer a request"""
+
+        path = path.split("?", 1)[0].rstrip("/")
+        if method == "GET" and path == "/jobs":
+            return 200, self.jobs.jobs()
+        if method == "GET" and path == "/status":
+            return 200, self.status()
+        if method == "POST" and path == "/jobs":
+            return self._add(body)
+        if method == "POST" and path == "/bandwidth":
+            return self._bandwidth(body)
+
+        match = re.fullmatch(r"/jobs/(\d+)(?:/(\w+))?", path)
+        if match is None:
+            return 404, {"error": "not found"}
+        job_id, action = int(match.group(1)), match.group(2)
+        if self.jobs.get(job_id) is None:
+            return 404, {"error": f"no job {job_id}"}
+
+        if method == "GET" and action is None:
+            return 200, self.jobs.get(job_id)
+        if method == "POST" and action == "priority":
+            if not isinstance(body.get("priority"), int):
+                return 400, {"error": "priority must be an integer"}
+            self.jobs.prioritise(job_id, body["priority"])
+        elif method == "POST" and action in _TRANSITIONS:
+            status, allowed = _TRANSITIONS[action]
+            if not self.jobs.transition(job_id, status, allowed):
+                return 409, {"error": f"job {job_id} cannot {action}"}
+        else:
+            return 404, {"error": "not found"}
+
+        self.on_change(job_id, action)
+        return 200, self.jobs.get(job_id)
+
+    def _add(self, body: dict) -> tuple[int, dict]:
+        urls = body.get("urls") or [body.get("url")]
+        chapters = body.get("chapters", "")
+        priority = body.get("priority", 0)
+        if not isinstance(chapters, str) or not isinstance(priority, int):
+            return 400, {"error": "chapters must be a string and priority an integer"}
+        for url in urls:
+            error = "url missing" if not isinstance(url, str) else self.validate(url, chapters)
+            if error:
+                return 400, {"error": error}
+
+        ids = [self.jobs.add(url, chapters, priority) for url in urls]
+        for job_id in ids:
+            self.on_change(job_id, "add")
+        return 201, {"ids": ids}
+
+    def _bandwidth(self, body: dict) -> tuple[int, dict]:
+        try:
+            rate = parse_rate(str(body["rate"])) if "rate" in body else None
+            host_rate = parse_rate(str(body["host_rate"])) if "host_rate" in body else None
+        except ValueError as excp:
+            return 400, {"error": str(excp)}
+        BANDWIDTH.configure(rate=rate, host_rate=host_rate)
+        return 200, {"bandwidth": BANDWIDTH.describe()}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    api: Api
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        self._answer("GET")
+
+    def do_POST(self) -> None:
+        self._answer("POST")
+
+    def _answer(self, method: str) -> None:
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("the body must be a json object")
+        except ValueError as excp:
+            status, payload = 400, {"error": str(excp)}
+        else:
+            status, payload = self.api.handle(method, self.path, body)
+
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+def start_api(address: str, api: Api) -> socketserver.BaseServer:
+    """serve api at address from a daemon thread and return the server
+    an address containing a "/" is the path of a unix socket, otherwise host:port"""
+
+    handler = type("ApiHandler", (_Handler,), {"api": api})
+    if "/" in address:
+        if os.path.exists(address):
+            os.remove(address)
+        server = _UnixServer(address, handler)
+    else:
+        server = ThreadingHTTPServer(split_address(address), handler)
+        server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="api", daemon=True).start()
+    return server
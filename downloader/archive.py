@@ -0,0 +1,323 @@
+"""streaming writer of the chapter archives"""
+
+import os
+import json
+import shutil
+import threading
+import tempfile
+import zlib
+from collections import deque
+from itertools import chain
+from typing import IO, Iterable, Iterator
+from zipfile import ZipFile, ZipInfo, ZIP_STORED, BadZipFile
+from .images import image_format
+
+
+class ChapterArchive:
+    """.cbz writer that stores the pages in order as they land
+    the next expected page is streamed straight into the archive, pages landing
+    out of order wait in a spooled buffer that spills to disk when large
+    the archive is written to a .part file and renamed into place when closed,
+    an interrupted archive keeps its pages and the partial ones to be resumed"""
+
+    def __init__(self, zip_path: str, spool_size: int = 2 << 20) -> None:
+        self.zip_path = zip_path
+        self.part_path = zip_path + ".part"
+        self.pages_dir = zip_path + ".pages"
+        self.spool_size = spool_size
+        self.sizes: dict[str, int] = {}
+        self._zip_file: ZipFile | None = None
+        self._loaded = False
+        self._order: deque[str] = deque()
+        self._buffered: dict[str, IO[bytes]] = {}
+        self._current = ""  # page being written by the writer
+        self._writing = False
+        self._lock = threading.Lock()
+
+    def expect(self, page_str: str) -> None:
+        """add a page at the end of the archive order"""
+
+        with self._lock:
+            self._load()
+            if page_str not in self.sizes and page_str not in self._order:
+                self._order.append(page_str)
+
+    def has(self, page_str: str) -> bool:
+        """return True if the page is already in the archive, or landed and
+        waiting to be written"""
+
+        with self._lock:
+            self._load()
+            return self._landed(page_str)
+
+    def partial_size(self, page_str: str) -> int:
+        """return the number of bytes of the page saved by an interrupted run"""
+
+        path = os.path.join(self.pages_dir, page_str)
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def partial_chunks(self, page_str: str) -> Iterator[bytes]:
+        """yield the bytes of the page saved by an interrupted run"""
+
+        with open(os.path.join(self.pages_dir, page_str), "rb") as partial_file:
+            yield from iter(lambda: partial_file.read(1 << 16), b"")
+
+    def add_page(self, page_str: str, chunks: Iterable[bytes]) -> int:
+        """add the content of a page to the archive, return its size
+        a page landed twice, e.g. by the final retry pass of a chapter, or that
+        is not expected is dropped and 0 is returned"""
+
+        with self._lock:
+            self._load()
+            if self._landed(page_str) or page_str not in self._order:
+                return 0
+            direct = not self._writing and bool(self._order) and self._order[0] == page_str
+            if direct:
+                self._writing = True
+                self._current = page_str
+
+        if direct:
+            try:
+                self._write_entry(page_str, chunks)
+            except BaseException:
+                with self._lock:
+                    self._writing = False
+                    self._current = ""
+                raise
+            with self._lock:
+                self._order.popleft()
+                self._current = ""
+            size = self.sizes[page_str]
+        else:
+            buffer = tempfile.SpooledTemporaryFile(
+                self.spool_size, dir=os.path.dirname(self.zip_path)
+            )
+            try:
+                for chunk in chunks:
+                    buffer.write(chunk)
+            except BaseException:
+                self._save_partial(page_str, buffer, 0, buffer.tell())
+                buffer.close()
+                raise
+            size = buffer.tell()
+            with self._lock:
+                if self._landed(page_str):
+                    # the same page landed meanwhile from another request
+                    buffer.close()
+                    return 0
+                self._buffered[page_str] = buffer
+                if self._writing:
+                    # the current writer will pick it up
+                    return size
+                self._writing = True
+
+        self._drain()
+        return size
+
+    def close(self) -> None:
+        """complete the archive and move it into place
+        the sizes of the pages are kept in the archive comment"""
+
+        with self._lock:
+            self._load()
+            if self._order or self._buffered:
+                raise ValueError(f"{len(self._order)} pages missing from the archive")
+            if self._zip_file is None:
+                self._open()
+            assert self._zip_file is not None
+            self._zip_file.comment = json.dumps(self.sizes).encode()
+            self._zip_file.close()
+            self._zip_file = None
+            os.replace(self.part_path, self.zip_path)
+            shutil.rmtree(self.pages_dir, ignore_errors=True)
+
+    def suspend(self) -> bool:
+        """store the pages landed so far and close the partial archive
+        return True if something has been kept to be resumed"""
+
+        with self._lock:
+            for page_str in sorted(self._buffered):
+                buffer = self._buffered.pop(page_str)
+                buffer.seek(0)
+                self._write_entry(page_str, iter(lambda: buffer.read(1 << 16), b""))
+                buffer.close()
+            self._order.clear()
+            if self._zip_file is not None:
+                self._zip_file.close()
+                self._zip_file = None
+            self._loaded = False
+            return os.path.exists(self.part_path) or os.path.exists(self.pages_dir)
+
+    def abort(self) -> None:
+        """drop the archive and every buffered page"""
+
+        with self._lock:
+            for buffer in self._buffered.values():
+                buffer.close()
+            self._buffered.clear()
+            self._order.clear()
+            self.sizes.clear()
+            if self._zip_file is not None:
+                self._zip_file.close()
+                self._zip_file = None
+            self._loaded = False
+            if os.path.exists(self.part_path):
+                os.remove(self.part_path)
+            shutil.rmtree(self.pages_dir, ignore_errors=True)
+
+    def _load(self) -> None:
+        """load the pages of a partial archive left by an interrupted run"""
+
+        if self._loaded:
+            return
+        self._loaded = True
+        self.sizes = {}
+        if not os.path.exists(self.part_path):
+            return
+        try:
+            self._zip_file = ZipFile(self.part_path, "a", ZIP_STORED)
+        except (BadZipFile, OSError):
+            os.remove(self.part_path)
+            return
+        for info in self._zip_file.infolist():
+            self.sizes[os.path.splitext(info.filename)[0]] = info.file_size
+
+    def _landed(self, page_str: str) -> bool:
+        return page_str in self.sizes or page_str in self._buffered or page_str == self._current
+
+    def _open(self) -> None:
+        self._zip_file = ZipFile(self.part_path, "w", ZIP_STORED)
+
+    def _drain(self) -> None:
+        """write the buffered pages that are next in order, then leave the writer role"""
+
+        while True:
+            with self._lock:
+                if not self._order or self._order[0] not in self._buffered:
+                    self._writing = False
+                    return
+                page_str = self._order[0]
+                buffer = self._buffered.pop(page_str)
+                self._current = page_str
+
+            try:
+                buffer.seek(0)
+                self._write_entry(page_str, iter(lambda: buffer.read(1 << 16), b""))
+            except BaseException:
+                with self._lock:
+                    self._writing = False
+                    self._current = ""
+                raise
+            finally:
+                buffer.close()
+
+            with self._lock:
+                self._order.popleft()
+                self._current = ""
+
+    def _write_entry(self, page_str: str, chunks: Iterable[bytes]) -> None:
+        """stream a page into a stored entry, only called by the writer"""
+
+        if self._zip_file is None:
+            self._open()
+        zip_file = self._zip_file
+        assert zip_file is not None
+
+        # the extension follows the content, the first chunk tells the format
+        chunks = iter(chunks)
+        head = next(chunks, b"")
+        start = zip_file.start_dir
+        info = ZipInfo(f"{page_str}.{image_format(head) or 'png'}")
+        info.compress_type = ZIP_STORED
+        written = 0
+        try:
+            with zip_file.open(info, "w") as entry:
+                for chunk in chain([head], chunks):
+                    entry.write(chunk)
+                    written += len(chunk)
+        except BaseException:
+            # the entry has been closed with partial content, keep the bytes
+            # to resume the page later and roll the entry back
+            if zip_file.filelist and zip_file.filelist[-1] is info:
+                zip_file.filelist.pop()
+                zip_file.NameToInfo.pop(info.filename, None)
+                self._save_partial(
+                    page_str, zip_file.fp, zip_file.start_dir - written, written
+                )
+            zip_file.start_dir = start
+            zip_file.fp.seek(start)
+            zip_file.fp.truncate()
+            raise
+
+        self.sizes[page_str] = written
+
+    def _save_partial(self, page_str: str, source: IO[bytes], start: int, length: int) -> None:
+        """copy the bytes of an interrupted page to the partial pages folder"""
+
+        if not length:
+            return
+        os.makedirs(self.pages_dir, exist_ok=True)
+        path = os.path.join(self.pages_dir, page_str)
+        source.seek(start)
+        with open(path + ".tmp", "wb") as partial_file:
+            while length > 0:
+                chunk = source.read(min(length, 1 << 16))
+                if not chunk:
+                    break
+                partial_file.write(chunk)
+                length -= len(chunk)
+        os.replace(path + ".tmp", path)
+
+
+def check_archive(zip_path: str) -> bool:
+    """check the central directory of a finished archive against the page sizes
+    stored in its comment, archives without the comment only need to open"""
+
+    try:
+        with ZipFile(zip_path) as zip_file:
+            infos = zip_file.infolist()
+            comment = zip_file.comment
+    except (BadZipFile, OSError):
+        return False
+    return not _directory_problem(infos, comment)
+
+
+def archive_problem(zip_path: str) -> str:
+    """return what is wrong with a finished archive, "" if nothing
+    the central directory is checked as in check_archive, then every page is
+    read back in chunks to check its crc, the archive is never loaded whole"""
+
+    try:
+        with ZipFile(zip_path) as zip_file:
+            problem = _directory_problem(zip_file.infolist(), zip_file.comment)
+            if problem:
+                return problem
+            bad_page = zip_file.testzip()
+    except (BadZipFile, OSError, EOFError, zlib.error) as excp:
+        return f"unreadable archive: {excp}"
+    return f"bad crc in {bad_page}" if bad_page else ""
+
+
+def verify_archive(zip_path: str) -> bool:
+    """check_archive, then read every page back to check its crc"""
+
+    return not archive_problem(zip_path)
+
+
+def _directory_problem(infos: list[ZipInfo], comment: bytes) -> str:
+    """return what is wrong with the entries of an archive given its comment"""
+
+    if not infos:
+        return "no page"
+    if not comment:
+        return ""
+    try:
+        sizes = json.loads(comment)
+    except ValueError:
+        return "unreadable page sizes"
+    if len(sizes) != len(infos) or not all(
+        sizes.get(os.path.splitext(info.filename)[0]) == info.file_size
+        for info in infos
+    ):
+        return "pages missing or truncated"
+    return ""
@@ -0,0 +1,350 @@
+"""asyncio download engine, alternative to the thread pool scheduler"""
+
+import time
+import asyncio
+import threading
+from concurrent.futures import Future, wait
+from itertools import chain
+from urllib.parse import urlsplit
+from typing import Callable, Iterator
+from .scheduler import ChapterJob, ChapterGroups
+from .retry import RetryPolicy
+from .metrics import METRICS
+from .bandwidth import BANDWIDTH
+from .concurrency import CONCURRENCY, FAILED, THROTTLED, HostLimiter, outcome_of
+
+aiohttp = None  # slow to import, loaded by the first engine
+
+
+def _load_aiohttp() -> None:
+    """import aiohttp into the module, once"""
+
+    global aiohttp
+    if aiohttp is None:
+        try:
+            import aiohttp
+        except ImportError:
+            raise ImportError("the asyncio engine requires aiohttp, pip install aiohttp") from None
+
+
+class AsyncEngine:
+    """engine that downloads every page as a lightweight task
+    the blocking site adapters are driven from worker threads, the images
+    are fetched by aiohttp under a global bound and the adaptive limit of
+    each host in CONCURRENCY
+    chapters can be submitted while the previous ones are downloading, the
+    event loop runs in its own thread until join
+    failures are retried with the same policy as the thread scheduler"""
+
+    def __init__(
+        self,
+        resolve: Callable[[ChapterJob], Iterator[tuple[str, str]]],
+        finalize: Callable[[ChapterJob], None],
+        stopped: Callable[[], bool],
+        timeout: int,
+        max_in_flight: int = 512,
+        max_chapters: int = 64,
+        retry: RetryPolicy | None = None,
+    ) -> None:
+        _load_aiohttp()
+
+        self._resolve = resolve
+        self._finalize = finalize
+        self._stopped = stopped
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.max_chapters = max_chapters
+        self.retry = retry or RetryPolicy()
+        self._thread: threading.Thread | None = None
+        self._tasks: set[Future] = set()  # chapters in flight, and the failed ones
+        self._lock = threading.Lock()  # the daemon submits from several threads
+        self._groups = ChapterGroups(self.retry)
+        self._released: dict[HostLimiter, tuple[asyncio.Condition, Callable]] = {}
+
+    def submit(self, job: ChapterJob) -> None:
+        """queue a chapter, the event loop is started by the first one"""
+
+        with self._lock:
+            if self._thread is None:
+                ready = threading.Event()
+                self._thread = threading.Thread(
+                    target=asyncio.run, args=(self._run(ready),), name="asyncio", daemon=True
+                )
+                self._thread.start()
+                ready.wait()
+            self._groups.enter(job)
+            task = asyncio.run_coroutine_threadsafe(self._chapter(job), self._loop)
+            self._tasks.add(task)
+        task.add_done_callback(self._forget)
+
+    def _forget(self, task: Future) -> None:
+        """drop a finished chapter, a failed one is kept to be raised by join"""
+
+        if task.cancelled() or task.exception() is None:
+            with self._lock:
+                self._tasks.discard(task)
+
+    def join(self) -> None:
+        """wait for every queued chapter, then stop the event loop"""
+
+        if self._thread is None:
+            return
+        with self._lock:
+            tasks = list(self._tasks)
+        wait(tasks)
+        self._loop.call_soon_threadsafe(self._closing.set)
+        self._thread.join()
+
+        with self._lock:
+            tasks, self._tasks = list(self._tasks), set()
+            self._thread = None
+        for task in tasks:
+            task.result()
+
+    async def _run(self, ready: threading.Event) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._closing = asyncio.Event()
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        self._chapters = asyncio.Semaphore(self.max_chapters)
+        self._released = {}
+
+        connector = aiohttp.TCPConnector(limit=self.max_in_flight, limit_per_host=0)
+        timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=self.timeout, sock_read=self.timeout
+        )
+        try:
+            async with aiohttp.ClientSession(
+                connector=connector, timeout=timeout, trace_configs=[_trace_config()]
+            ) as session:
+                self._session = session
+                ready.set()
+                await self._closing.wait()
+
+                # final pass over the chapters that were still failing
+                parked = self._groups.take()
+                if self._stopped():
+                    for job in parked:
+                        await asyncio.to_thread(self._finalize, job)
+                    return
+                for job in parked:
+                    job._restart()
+                await asyncio.gather(*(self._chapter(job, final=True) for job in parked))
+        finally:
+            # the loop is closing, the limiters must not call it any more
+            for limiter, (_, listener) in self._released.items():
+                limiter.unlisten(listener)
+
+    async def _acquire(self, url: str) -> HostLimiter:
+        """wait for a slot of the host of url and return its limiter"""
+
+        limiter = CONCURRENCY.host(url)
+        if limiter not in self._released:
+            # every release of the host wakes its waiters, including the ones of
+            # the adapter threads and of the other engines
+            released = asyncio.Condition()
+
+            def listener() -> None:
+                try:
+                    self._loop.call_soon_threadsafe(self._wake, released)
+                except RuntimeError:
+                    pass  # released by a thread while the loop was closing
+
+            self._released[limiter] = (released, listener)
+            limiter.listen(listener)
+        released = self._released[limiter][0]
+
+        async with released:
+            # nothing runs on the loop between the check and the wait, a release
+            # meanwhile is notified once the waiter is registered
+            while not limiter.try_acquire():
+                await released.wait()
+        return limiter
+
+    def _wake(self, released: asyncio.Condition) -> None:
+        self._loop.create_task(self._notify(released))
+
+    async def _notify(self, released: asyncio.Condition) -> None:
+        """wake up the waiters of a host after one of its slots has been freed, two
+        of them since the limit may have grown by one"""
+
+        async with released:
+            released.notify(2)
+
+    async def _release(self, url: str, limiter: HostLimiter, latency: float, outcome: str) -> None:
+        """free the slot of the host of url, its waiters are woken by the limiter"""
+
+        limiter.release(latency, outcome)
+
+    async def _chapter(self, job: ChapterJob, final: bool = False) -> None:
+        async with self._chapters:
+            if self._stopped():
+                return
+
+            pages = [] if job.cancelled else await self._resolve_pages(job)
+            if not job.error and not job.cancelled:
+                await asyncio.gather(
+                    *(
+                        self._page(job, page_str, image_link)
+                        for page_str, image_link in pages
+                    )
+                )
+
+        if job.error and not job.cancelled and not final and not job._final and not self._stopped():
+            self._groups.park(job)
+        else:
+            await asyncio.to_thread(self._finalize, job)
+
+        # the last chapter of a group in flight runs the final pass of the group
+        restart = self._groups.leave(job)
+        if self._stopped():
+            for parked in restart:
+                await asyncio.to_thread(self._finalize, parked)
+        elif restart:
+            await asyncio.gather(*(self._chapter(parked) for parked in restart))
+
+    async def _resolve_pages(self, job: ChapterJob) -> list[tuple[str, str]]:
+        """return the pages of the chapter, an empty list if it failed"""
+
+        attempt = 0
+        while True:
+            try:
+                # the adapters are blocking, resolve the pages in a worker thread
+                return await asyncio.to_thread(list, self._resolve(job))
+            except Exception as excp:
+                if (
+                    self._stopped()
+                    or job.cancelled
+                    or not self.retry.allow(attempt, excp, job.group)
+                ):
+                    job.fail(f"error type: {excp}")
+                    return []
+                job.record_retry()
+                await asyncio.sleep(self.retry.delay(attempt, excp))
+                attempt += 1
+
+    async def _page(
+        self,
+        job: ChapterJob,
+        page_str: str,
+        image_link: str,
+    ) -> None:
+        attempt = 0
+        while True:
+            try:
+                await self._fetch_page(job, page_str, image_link)
+                return
+            except Exception as excp:
+                if (
+                    job.error
+                    or job.cancelled
+                    or self._stopped()
+                    or not self.retry.allow(attempt, excp, job.group)
+                ):
+                    job.fail(f"error type: {excp}")
+                    return
+                job.record_retry()
+                await asyncio.sleep(self.retry.delay(attempt, excp))
+                attempt += 1
+
+    async def _fetch_page(
+        self,
+        job: ChapterJob,
+        page_str: str,
+        image_link: str,
+    ) -> None:
+        if job.archive.has(page_str):
+            return
+
+        headers = job.request_headers(page_str)
+        timings: dict[str, float] = {}
+        try:
+            async with self._in_flight:
+                if job.error or job.cancelled or self._stopped():
+                    return
+                limiter = await self._acquire(image_link)
+                outcome = FAILED
+                start = time.perf_counter()
+                try:
+                    async with self._session.get(
+                        image_link, headers=headers, trace_request_ctx=timings
+                    ) as response:
+                        outcome = outcome_of(response.status)
+                        response.raise_for_status()
+                        job.manifest.record(page_str, response.status, response.headers)
+                        headers_received = time.perf_counter()
+                        host = urlsplit(image_link).netloc
+                        data = []
+                        async for chunk in response.content.iter_chunked(1 << 16):
+                            data.append(chunk)
+                            delay = BANDWIDTH.delay(host, len(chunk))
+                            if delay:
+                                await asyncio.sleep(delay)
+                        METRICS.record_request(
+                            host=host,
+                            url=image_link,
+                            status=response.status,
+                            transfer=time.perf_counter() - headers_received,
+                            bytes=sum(len(chunk) for chunk in data),
+                            error="",
+                            **timings,
+                        )
+                except asyncio.TimeoutError:
+                    outcome = THROTTLED
+                    raise
+                finally:
+                    await self._release(image_link, limiter, timings.get("ttfb", 0), outcome)
+            chunks = data
+            if response.status == 206:
+                chunks = chain(job.archive.partial_chunks(page_str), chunks)
+            size = await asyncio.to_thread(job.archive.add_page, page_str, chunks)
+            job.record_page(start, time.perf_counter(), size)
+        except Exception as excp:
+            METRICS.record_request(
+                host=urlsplit(image_link).netloc,
+                url=image_link,
+                status=getattr(excp, "status", 0),
+                error=str(excp),
+                **timings,
+            )
+            raise
+
+
+def _trace_config() -> "aiohttp.TraceConfig":
+    """return a trace config filling the timings dict passed as trace_request_ctx"""
+
+    async def request_start(session, context, params) -> None:
+        context.start = time.perf_counter()
+        context.trace_request_ctx.clear()
+
+    async def dns_start(session, context, params) -> None:
+        context.dns_start = time.perf_counter()
+
+    async def dns_end(session, context, params) -> None:
+        context.trace_request_ctx["dns"] = time.perf_counter() - context.dns_start
+
+    async def connection_start(session, context, params) -> None:
+        context.connection_start = time.perf_counter()
+
+    async def connection_end(session, context, params) -> None:
+        timings = context.trace_request_ctx
+        timings["connect"] = (
+            time.perf_counter() - context.connection_start - timings.get("dns", 0)
+        )
+
+    async def request_end(session, context, params) -> None:
+        timings = context.trace_request_ctx
+        timings["ttfb"] = (
+            time.perf_counter()
+            - context.start
+            - timings.get("dns", 0)
+            - timings.get("connect", 0)
+        )
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(request_start)
+    trace_config.on_dns_resolvehost_start.append(dns_start)
+    trace_config.on_dns_resolvehost_end.append(dns_end)
+    trace_config.on_connection_create_start.append(connection_start)
+    trace_config.on_connection_create_end.append(connection_end)
+    trace_config.on_request_end.append(request_end)
+    return trace_config
@@ -0,0 +1,114 @@
+"""token buckets capping the bytes per second of the downloads"""
+
+import re
+import time
+import threading
+from typing import Iterator
+
+_UNITS = {"": 1, "k": 1e3, "m": 1e6, "g": 1e9}
+
+
+def parse_rate(text: str) -> float:
+    """return the bytes per second of "500K", "2M", "2MB/s" or "1000000", 0 is unlimited"""
+
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmg]?)(?:i?b)?(?:/s)?\s*", text.lower())
+    if match is None:
+        raise ValueError(f"invalid rate '{text}'")
+    return float(match.group(1)) * _UNITS[match.group(2)]
+
+
+def format_rate(rate: float) -> str:
+    """return rate in a short printable form"""
+
+    return f"{rate / 1e6:.1f} MB/s" if rate else "unlimited"
+
+
+class TokenBucket:
+    """bucket filled with rate bytes per second, holding up to one second of them
+    a consumer may take more bytes than the bucket holds: the bucket goes into
+    debt and the consumer waits until the debt is repaid, so whole chunks are
+    taken at once and the waits of concurrent consumers queue up fairly"""
+
+    def __init__(self, rate: float = 0.0) -> None:
+        self.rate = rate
+        self.tokens = rate
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate: float) -> None:
+        """change the rate, the bytes already accounted for keep the previous one"""
+
+        with self._lock:
+            self._refill()
+            self.rate = rate
+            self.tokens = min(self.tokens, rate)
+
+    def reserve(self, amount: int) -> float:
+        """take amount bytes and return the seconds to wait before using them"""
+
+        with self._lock:
+            if not self.rate:
+                return 0.0
+            self._refill()
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(self.tokens + (now - self._updated) * self.rate, self.rate)
+        self._updated = now
+
+
+class BandwidthLimiter:
+    """bucket shared by every download, plus an optional bucket for each host
+    the rates can be changed at any time, including during the downloads"""
+
+    def __init__(self, rate: float = 0.0, host_rate: float = 0.0) -> None:
+        self.total = TokenBucket(rate)
+        self.host_rate = host_rate
+        self._hosts: dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, rate: float | None = None, host_rate: float | None = None) -> None:
+        """change the total and the per host rates, None keeps the current one"""
+
+        if rate is not None:
+            self.total.set_rate(rate)
+        if host_rate is not None:
+            with self._lock:
+                self.host_rate = host_rate
+                for bucket in self._hosts.values():
+                    bucket.set_rate(host_rate)
+
+    def delay(self, host: str, amount: int) -> float:
+        """take amount bytes received from host, return the seconds to wait"""
+
+        delay = self.total.reserve(amount)
+        if self.host_rate:
+            with self._lock:
+                bucket = self._hosts.get(host)
+                if bucket is None:
+                    bucket = self._hosts[host] = TokenBucket(self.host_rate)
+            delay = max(delay, bucket.reserve(amount))
+        return delay
+
+    def limited(self, host: str, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        """yield the chunks received from host, no faster than the rates"""
+
+        for chunk in chunks:
+            delay = self.delay(host, len(chunk))
+            if delay:
+                time.sleep(delay)
+            yield chunk
+
+    def describe(self) -> str:
+        """return the rates in a short printable form"""
+
+        description = format_rate(self.total.rate)
+        if self.host_rate:
+            description += f", {format_rate(self.host_rate)} per host"
+        return description
+
+
+BANDWIDTH = BandwidthLimiter()
@@ -0,0 +1,153 @@
+"""adaptive limit of the requests in flight to each host"""
+
+import time
+import threading
+from typing import Callable
+from urllib.parse import urlsplit
+
+# outcomes of a request
+SUCCESS = "success"
+THROTTLED = "throttled"  # 429, 503 or a timeout
+FAILED = "failed"  # any other error, the limit is left untouched
+
+
+def outcome_of(status: int, timed_out: bool = False) -> str:
+    """classify a request from its status code"""
+
+    if timed_out or status in (429, 503):
+        return THROTTLED
+    if 200 <= status < 400:
+        return SUCCESS
+    return FAILED
+
+
+class HostLimiter:
+    """AIMD limit of a host
+    every success with a latency close to the best one seen adds 1 / limit, so
+    the limit grows by one per window of requests, while a throttled request or
+    a latency above twice the best one shrinks the limit, at most once per window"""
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 64) -> None:
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self.base_latency = 0.0
+        self.latency = 0.0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        self._listeners: list[Callable[[], None]] = []
+
+    def try_acquire(self) -> bool:
+        """take a slot if one is free"""
+
+        with self._condition:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self) -> None:
+        """wait for a free slot and take it"""
+
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency: float, outcome: str) -> None:
+        """free a slot and adapt the limit to the outcome of the request"""
+
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+
+            if outcome == SUCCESS and latency > 0:
+                self.latency = latency if not self.latency else 0.8 * self.latency + 0.2 * latency
+                if not self.base_latency or latency < self.base_latency:
+                    self.base_latency = latency
+                else:
+                    # let the baseline follow a path that became slower
+                    self.base_latency += (latency - self.base_latency) * 0.01
+
+            window = max(self.latency, 0.05)
+            if outcome == THROTTLED:
+                self._decrease(now, window, 0.5)
+            elif outcome == SUCCESS:
+                if self.latency > 2 * self.base_latency > 0:
+                    self._decrease(now, window, 0.9)
+                else:
+                    self.limit = min(self.limit + 1 / self.limit, self.maximum)
+
+            self._condition.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+    def listen(self, listener: Callable[[], None]) -> None:
+        """call listener, in the releasing thread, every time a slot is freed,
+        for the waiters that cannot block on the condition, such as coroutines"""
+
+        with self._condition:
+            self._listeners.append(listener)
+
+    def unlisten(self, listener: Callable[[], None]) -> None:
+        """stop calling listener"""
+
+        with self._condition:
+            self._listeners.remove(listener)
+
+    def _decrease(self, now: float, window: float, factor: float) -> None:
+        if now - self._last_decrease > window:
+            self.limit = max(self.limit * factor, self.minimum)
+            self._last_decrease = now
+
+
+class ConcurrencyController:
+    """collection of the limiters of every host"""
+
+    def __init__(self, initial: int = 8, maximum: int = 64) -> None:
+        self.initial = initial
+        self.maximum = maximum
+        self._hosts: dict[str, HostLimiter] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, initial: int = 0, maximum: int = 0) -> None:
+        """change the starting and the maximum limit of the hosts seen from now on"""
+
+        with self._lock:
+            self.initial = initial or self.initial
+            self.maximum = maximum or self.maximum
+            self._hosts.clear()
+
+    def host(self, url: str) -> HostLimiter:
+        """return the limiter of the host of url"""
+
+        host = urlsplit(url).netloc
+        with self._lock:
+            limiter = self._hosts.get(host)
+            if limiter is None:
+                limiter = self._hosts[host] = HostLimiter(self.initial, maximum=self.maximum)
+            return limiter
+
+    def cap(self, url: str, maximum: int) -> None:
+        """bound the limit of the host of url, e.g. to the concurrency a website tolerates"""
+
+        limiter = self.host(url)
+        with limiter._condition:
+            limiter.maximum = min(limiter.maximum, maximum)
+            limiter.limit = min(limiter.limit, limiter.maximum)
+
+    def limits(self) -> dict[str, int]:
+        """return the current limit of every host"""
+
+        with self._lock:
+            return {host: int(limiter.limit) for host, limiter in self._hosts.items()}
+
+    def describe(self) -> str:
+        """return the current limits in a short printable form"""
+
+        return " ".join(f"{host}:{limit}" for host, limit in self.limits().items())
+
+
+CONCURRENCY = ConcurrencyController()
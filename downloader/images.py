@@ -0,0 +1,106 @@
+"""detection of the image formats and optional re-encoding of the pages"""
+
+import io
+import os
+import json
+from zipfile import ZipFile, ZipInfo, ZIP_STORED
+from .parallel import CPU
+
+Image = None  # Pillow, loaded by the first re-encoder and in the worker processes
+
+# extension -> Pillow format
+FORMATS = {"webp": "WEBP", "avif": "AVIF", "jxl": "JXL", "jpg": "JPEG", "png": "PNG"}
+
+
+def image_format(head: bytes) -> str:
+    """return the extension of the image starting with head, "" if unknown"""
+
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[4:12] in (b"ftypavif", b"ftypavis"):
+        return "avif"
+    if head.startswith((b"\xff\x0a", b"\x00\x00\x00\x0cJXL \r\n\x87\n")):
+        return "jxl"
+    return ""
+
+
+def _load_pillow() -> None:
+    """import the Image module of Pillow into the module, once"""
+
+    global Image
+    if Image is None:
+        try:
+            from PIL import Image
+        except ImportError:
+            raise ImportError("re-encoding the pages requires Pillow, pip install Pillow") from None
+
+
+def encode(data: bytes, extension: str, quality: int) -> bytes:
+    """return the image re-encoded to the format of extension, run in a worker process"""
+
+    _load_pillow()
+    with Image.open(io.BytesIO(data)) as image:
+        if extension == "jpg" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        if extension == "png":
+            image.save(output, "PNG", optimize=True)
+        else:
+            image.save(output, FORMATS[extension], quality=quality)
+    return output.getvalue()
+
+
+class Reencoder:
+    """re-encoder of the pages of finished archives on the cpu pool
+    a page is kept as served when its new encoding is not smaller"""
+
+    def __init__(self, extension: str, quality: int = 80) -> None:
+        _load_pillow()
+        if extension not in FORMATS:
+            raise ValueError(f"unknown image format '{extension}'")
+        # the writers depend on the build of Pillow and on its plugins
+        Image.init()
+        if FORMATS[extension] not in Image.SAVE:
+            raise ValueError(f"this build of Pillow cannot write {extension} images")
+
+        self.extension = extension
+        self.quality = quality
+
+    def reencode(self, zip_path: str) -> tuple[int, list[str]]:
+        """re-encode the pages of the archive at zip_path, return the bytes saved
+        and the errors of the pages kept as served because they failed"""
+
+        with ZipFile(zip_path) as zip_file:
+            pages = [(info.filename, zip_file.read(info)) for info in zip_file.infolist()]
+
+        futures = [
+            CPU.submit(encode, data, self.extension, self.quality)
+            for _, data in pages
+        ]
+        sizes: dict[str, int] = {}
+        saved = 0
+        failures = []
+        part_path = zip_path + ".part"
+        with ZipFile(part_path, "w", ZIP_STORED) as zip_file:
+            for (filename, data), future in zip(pages, futures):
+                page_str = os.path.splitext(filename)[0]
+                try:
+                    encoded = future.result()
+                except Exception as excp:
+                    failures.append(f"page {page_str}: {excp}")
+                    encoded = data
+                if len(encoded) < len(data):
+                    saved += len(data) - len(encoded)
+                    data = encoded
+                    filename = f"{page_str}.{self.extension}"
+                zip_file.writestr(ZipInfo(filename), data)
+                sizes[page_str] = len(data)
+            zip_file.comment = json.dumps(sizes).encode()
+        os.replace(part_path, zip_path)
+        return saved, failures
@@ -0,0 +1,170 @@
+"""persistent queue of the download jobs of the daemon"""
+
+import os
+import time
+import sqlite3
+import threading
+from .library import library_folder
+
+# status of a job
+QUEUED = "queued"
+RUNNING = "running"
+PAUSED = "paused"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+_SCHEMA = """
+create table if not exists jobs (
+    id integer primary key autoincrement,
+    url text not null,
+    chapters text not null default '',
+    priority integer not null default 0,
+    status text not null,
+    done integer not null default 0,
+    total integer not null default 0,
+    error text not null default '',
+    created real not null,
+    updated real not null
+);
+create index if not exists jobs_queue on jobs (status, priority desc, id);
+"""
+
+_COLUMNS = ("id", "url", "chapters", "priority", "status", "done", "total", "error", "created", "updated")
+
+
+class JobQueue:
+    """sqlite queue of the jobs, a job downloads the selected chapters of a manga
+    the queue survives restarts: the jobs running when the daemon stopped are
+    queued again by recover"""
+
+    def __init__(self, path: str = "") -> None:
+        self.path = path
+        self._connection: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            if not self.path:
+                self.path = os.path.join(library_folder(), ".jobs.sqlite3")
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("pragma journal_mode=wal")
+            self._connection.executescript(_SCHEMA)
+        return self._connection
+
+    def _execute(self, query: str, parameters: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                return connection.execute(query, parameters)
+
+    def add(self, url: str, chapters: str = "", priority: int = 0) -> int:
+        """queue a job and return its id"""
+
+        now = time.time()
+        return self._execute(
+            "insert into jobs (url, chapters, priority, status, created, updated)"
+            " values (?, ?, ?, ?, ?, ?)",
+            (url, chapters, priority, QUEUED, now, now),
+        ).lastrowid
+
+    def get(self, job_id: int) -> dict | None:
+        """return the job with job_id, None if there is none"""
+
+        row = self._execute(
+            f"select {', '.join(_COLUMNS)} from jobs where id = ?", (job_id,)
+        ).fetchone()
+        return dict(zip(_COLUMNS, row)) if row else None
+
+    def jobs(self) -> list[dict]:
+        """return every job, the next ones to run first"""
+
+        rows = self._execute(
+            f"select {', '.join(_COLUMNS)} from jobs order by"
+            " status != 'running', status != 'queued', priority desc, id"
+        ).fetchall()
+        return [dict(zip(_COLUMNS, row)) for row in rows]
+
+    def claim(self, exclude: tuple[int, ...] = ()) -> dict | None:
+        """mark the queued job with the highest priority as running and return it,
+        the jobs of exclude, e.g. still finishing a paused run, stay queued"""
+
+        excluded = f" and id not in ({', '.join('?' * len(exclude))})" if exclude else ""
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                row = connection.execute(
+                    f"select {', '.join(_COLUMNS)} from jobs where status = ?{excluded}"
+                    " order by priority desc, id limit 1",
+                    (QUEUED, *exclude),
+                ).fetchone()
+                if row is None:
+                    return None
+                connection.execute(
+                    "update jobs set status = ?, error = '', updated = ? where id = ?",
+                    (RUNNING, time.time(), row[0]),
+                )
+        job = dict(zip(_COLUMNS, row))
+        job["status"] = RUNNING
+        return job
+
+    def transition(self, job_id: int, status: str, allowed: tuple[str, ...]) -> bool:
+        """set the status of the job if it is one of allowed, return True if set"""
+
+        placeholders = ", ".join("?" * len(allowed))
+        return bool(
+            self._execute(
+                f"update jobs set status = ?, updated = ? where id = ? and status in ({placeholders})",
+                (status, time.time(), job_id, *allowed),
+            ).rowcount
+        )
+
+    def prioritise(self, job_id: int, priority: int) -> bool:
+        """change the priority of the job, return True if it exists"""
+
+        return bool(
+            self._execute(
+                "update jobs set priority = ?, updated = ? where id = ?",
+                (priority, time.time(), job_id),
+            ).rowcount
+        )
+
+    def progress(self, job_id: int, done: int, total: int) -> None:
+        """record the number of chapters done out of total"""
+
+        self._execute(
+            "update jobs set done = ?, total = ?, updated = ? where id = ?",
+            (done, total, time.time(), job_id),
+        )
+
+    def finish(self, job_id: int, status: str, error: str = "") -> None:
+        """end a running job, a job paused or cancelled meanwhile keeps that status"""
+
+        self._execute(
+            "update jobs set status = ?, error = ?, updated = ? where id = ? and status = ?",
+            (status, error, time.time(), job_id, RUNNING),
+        )
+
+    def recover(self) -> int:
+        """queue again the jobs left running by a stopped daemon, return their number"""
+
+        return self._execute(
+            "update jobs set status = ? where status = ?", (QUEUED, RUNNING)
+        ).rowcount
+
+    def counts(self) -> dict[str, int]:
+        """return the number of jobs of each status"""
+
+        return dict(self._execute("select status, count(*) from jobs group by status").fetchall())
+
+    def close(self) -> None:
+        """close the database"""
+
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+JOBS = JobQueue()
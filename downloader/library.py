@@ -0,0 +1,143 @@
+"""manifest of the downloaded mangas, used to update a whole library"""
+
+import os
+import time
+import sqlite3
+import threading
+
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+create table if not exists mangas (
+    url text primary key,
+    website text not null,
+    name text not null,
+    checked real not null default 0
+);
+create table if not exists chapters (
+    url text not null,
+    name text not null,
+    status text not null,
+    updated real not null,
+    primary key (url, name)
+);
+"""
+
+
+def library_folder() -> str:
+    """return the folder where the mangas are downloaded"""
+
+    return os.path.join(os.path.expanduser("~"), "Mangas")
+
+
+class Library:
+    """sqlite manifest of the tracked mangas and of the status of their chapters
+    the database is opened on first use, it can be shared between threads"""
+
+    def __init__(self, path: str = "") -> None:
+        self.path = path
+        self._connection: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            if not self.path:
+                self.path = os.path.join(library_folder(), ".library.sqlite3")
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("pragma journal_mode=wal")
+            self._connection.execute("pragma synchronous=normal")
+            self._connection.executescript(_SCHEMA)
+        return self._connection
+
+    def track(self, manga: dict) -> None:
+        """add the manga to the library, or refresh its name"""
+
+        if not manga.get("url"):
+            return
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "insert into mangas (url, website, name, checked) values (?, ?, ?, ?)"
+                    " on conflict (url) do update set name = excluded.name,"
+                    " checked = excluded.checked",
+                    (manga["url"], manga["website"], manga["name"], time.time()),
+                )
+
+    def mangas(self) -> list[tuple[str, str, str]]:
+        """return the url, website and name of every tracked manga"""
+
+        with self._lock:
+            return self._connect().execute(
+                "select url, website, name from mangas order by name"
+            ).fetchall()
+
+    def record(self, manga: dict, chapter_name: str, status: str) -> None:
+        """set the status of a chapter of a tracked manga"""
+
+        if not manga.get("url"):
+            return
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "insert or replace into chapters (url, name, status, updated)"
+                    " values (?, ?, ?, ?)",
+                    (manga["url"], chapter_name, status, time.time()),
+                )
+
+    def known(self, manga: dict) -> set[str]:
+        """return the names of the chapters of manga downloaded by the previous runs,
+        the failed ones, and the ones quarantined by a check, are left out"""
+
+        if not manga.get("url"):
+            return set()
+        with self._lock:
+            return {
+                name
+                for (name,) in self._connect().execute(
+                    "select name from chapters where url = ? and status = ?",
+                    (manga["url"], DONE),
+                )
+            }
+
+    def missing(
+        self, manga: dict, folder_path: str, chapters: list[dict] | None = None
+    ) -> list[dict]:
+        """return the chapters of manga, or among chapters, that are not known
+        to be in folder_path"""
+
+        done: set[str] = set()
+        if manga.get("url"):
+            with self._lock:
+                done = {
+                    name
+                    for (name,) in self._connect().execute(
+                        "select name from chapters where url = ? and status = ?",
+                        (manga["url"], DONE),
+                    )
+                }
+        # one listing of the folder instead of a stat for every chapter
+        try:
+            present = set(os.listdir(folder_path))
+        except FileNotFoundError:
+            present = set()
+
+        return [
+            chapter
+            for chapter in (manga["list_chapters"] if chapters is None else chapters)
+            if chapter["name"] not in done or chapter["name"] + ".cbz" not in present
+        ]
+
+    def close(self) -> None:
+        """close the database"""
+
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+LIBRARY = Library()
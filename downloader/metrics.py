@@ -0,0 +1,178 @@
+"""timings of the requests and of the chapters, with an optional json-lines trace"""
+
+import json
+import time
+import threading
+from typing import IO, Iterator
+
+
+def percentile(values: list[float], share: float) -> float:
+    """return the value below which share of the values fall"""
+
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(share * len(ordered)), len(ordered) - 1)]
+
+
+class Metrics:
+    """collector of the request and chapter records of a download
+    every record is kept in memory for the summary and, when a trace file is
+    open, written to it as a json line"""
+
+    def __init__(self) -> None:
+        self.requests: list[dict] = []
+        self.chapters: list[dict] = []
+        self.started = time.perf_counter()
+        self._trace: IO[str] | None = None
+        self._lock = threading.Lock()
+
+    def open_trace(self, path: str) -> None:
+        """append every following record to the json-lines file at path"""
+
+        with self._lock:
+            self._trace = open(path, "a", encoding="utf-8")
+
+    def close_trace(self) -> None:
+        """close the trace file"""
+
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
+
+    def reset(self) -> None:
+        """forget the records, the trace file stays open"""
+
+        with self._lock:
+            self.requests = []
+            self.chapters = []
+            self.started = time.perf_counter()
+
+    def record_request(self, **record) -> None:
+        """record a request: host, url, status, dns, connect, tls, ttfb, transfer,
+        bytes and error, times in seconds"""
+
+        self._record(self.requests, "request", record)
+
+    def record_chapter(self, **record) -> None:
+        """record a chapter: manga, name, resolve, download, zip, encode, bytes,
+        pages, retries, bytes saved by re-encoding, pages whose re-encoding failed
+        and error, times in seconds"""
+
+        self._record(self.chapters, "chapter", record)
+
+    def _record(self, records: list[dict], kind: str, record: dict) -> None:
+        record["time"] = time.time()
+        with self._lock:
+            records.append(record)
+            if self._trace is not None:
+                self._trace.write(json.dumps({"type": kind, **record}) + "\n")
+                self._trace.flush()
+
+    def timed_chunks(self, host: str, url: str, status: int, timings: dict, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        """yield the chunks of a streamed body, recording the request once consumed"""
+
+        start = time.perf_counter()
+        size = 0
+        error = ""
+        try:
+            for chunk in chunks:
+                size += len(chunk)
+                yield chunk
+        except BaseException as excp:
+            error = str(excp) or type(excp).__name__
+            raise
+        finally:
+            self.record_request(
+                host=host,
+                url=url,
+                status=status,
+                transfer=time.perf_counter() - start,
+                bytes=size,
+                error=error,
+                **timings,
+            )
+
+    def summary(self) -> str:
+        """return a printable summary of the records"""
+
+        with self._lock:
+            requests = list(self.requests)
+            chapters = list(self.chapters)
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        lines = []
+
+        def milliseconds(values: list[float]) -> str:
+            return (
+                f"p50 {percentile(values, 0.5) * 1000:.0f} ms"
+                f" p95 {percentile(values, 0.95) * 1000:.0f} ms"
+            )
+
+        if requests:
+            failed = sum(
+                1
+                for record in requests
+                if record.get("error") or record.get("status", 0) >= 400
+            )
+            connected = [record for record in requests if record.get("connect")]
+            total_bytes = sum(record.get("bytes", 0) for record in requests)
+            lines.append(
+                f"requests: {len(requests)} ({failed} failed),"
+                f" ttfb {milliseconds([record.get('ttfb', 0) for record in requests])},"
+                f" transfer {milliseconds([record.get('transfer', 0) for record in requests])}"
+            )
+            if connected:
+                lines.append(
+                    f"connections: {len(connected)} new,"
+                    f" dns {milliseconds([record.get('dns', 0) for record in connected])},"
+                    f" connect {milliseconds([record['connect'] for record in connected])}"
+                )
+            lines.append(
+                f"throughput: {total_bytes / elapsed / 1e6:.2f} MB/s over {elapsed:.1f} s"
+            )
+
+            hosts: dict[str, list[float]] = {}
+            for record in requests:
+                hosts.setdefault(record["host"], []).append(
+                    record.get("ttfb", 0) + record.get("transfer", 0)
+                )
+            slowest = sorted(hosts.items(), key=lambda entry: -percentile(entry[1], 0.95))
+            lines.append(
+                "slowest hosts: "
+                + ", ".join(
+                    f"{host} (p95 {percentile(values, 0.95) * 1000:.0f} ms, {len(values)} req)"
+                    for host, values in slowest[:3]
+                )
+            )
+
+        if chapters:
+            pages = sum(record.get("pages", 0) for record in chapters)
+            retries = sum(record.get("retries", 0) for record in chapters)
+            lines.append(
+                f"chapters: {len(chapters)}, {pages / elapsed:.1f} pages/s,"
+                f" {retries} retries"
+            )
+            for stage in ("resolve", "download", "zip", "encode"):
+                if stage == "encode" and not any(record.get(stage) for record in chapters):
+                    continue
+                lines.append(
+                    f"  {stage:<9}{milliseconds([record.get(stage, 0) for record in chapters])}"
+                )
+
+            saved = sum(record.get("saved", 0) for record in chapters)
+            unencoded = sum(record.get("unencoded", 0) for record in chapters)
+            if saved or unencoded:
+                downloaded = max(sum(record.get("bytes", 0) for record in chapters), 1)
+                line = (
+                    f"re-encoding saved {saved / 1e6:.1f} MB ({100 * saved / downloaded:.0f}%),"
+                    f" {saved / len(chapters) / 1e6:.2f} MB per chapter"
+                )
+                if unencoded:
+                    line += f", {unencoded} pages kept as served after an error"
+                lines.append(line)
+
+        return "\n".join(lines)
+
+
+METRICS = Metrics()
@@ -0,0 +1,112 @@
+"""executor of the cpu bound stages, parallel with or without the GIL"""
+
+import os
+import sys
+import signal
+import threading
+import multiprocessing
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator
+
+MODES = ("auto", "threads", "processes")
+
+
+def gil_enabled() -> bool:
+    """return False only on a free-threaded interpreter running without the GIL"""
+
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled() if is_gil_enabled is not None else True
+
+
+def _ignore_sigint() -> None:
+    """initializer of the worker processes, CTRL+C is left to the main process,
+    which ends its stages cleanly"""
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class CpuPool:
+    """pool running the parsing, the crc checks and the re-encoding
+    on a free-threaded interpreter threads run them in parallel, otherwise they
+    go to processes so that they do not hold the GIL of the download threads
+    the executor is created on first use"""
+
+    def __init__(self, mode: str = "auto", workers: int = 0, offload_size: int = 1 << 20) -> None:
+        self.offload_size = offload_size  # smallest text worth sending to a process
+        self._executor: Executor | None = None
+        self._lock = threading.Lock()
+        self.configure(mode, workers)
+
+    def configure(self, mode: str = "auto", workers: int = 0) -> None:
+        """set the kind of workers, auto picks threads when the GIL is disabled"""
+
+        if mode not in MODES:
+            raise ValueError(f"unknown cpu pool mode '{mode}'")
+        self.close()
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+
+    @property
+    def threaded(self) -> bool:
+        """True if the stages run on threads"""
+
+        return self.mode == "threads" or (self.mode == "auto" and not gil_enabled())
+
+    def submit(self, function: Callable, *args) -> Future:
+        """run function(*args) on the pool, function has to be picklable"""
+
+        return self._get().submit(function, *args)
+
+    def run(self, function: Callable, *args) -> Any:
+        """return function(*args), computed where it is the cheapest
+        without the GIL the calling thread already runs in parallel, and a small
+        text costs more to send to a process than to parse in place"""
+
+        size = sum(len(arg) for arg in args if isinstance(arg, (str, bytes)))
+        if self.threaded or size < self.offload_size:
+            return function(*args)
+        return self.submit(function, *args).result()
+
+    def map(self, function: Callable, iterable: Iterable) -> list:
+        """return the results of function over iterable, run on the pool"""
+
+        return list(self._get().map(function, iterable))
+
+    def imap(self, function: Callable, items: list, batch: int = 0) -> Iterator:
+        """yield the results of function over items in order as they come,
+        items are sent to the processes by batches, of a size fitting the pool
+        by default, to bound the cost of the transfers"""
+
+        batch = batch or max(1, min(64, len(items) // (8 * self.workers)))
+        return self._get().map(function, items, chunksize=batch)
+
+    def describe(self) -> str:
+        """return a short description of the pool"""
+
+        kind = "threads" if self.threaded else "processes"
+        return f"{self.workers} {kind}, GIL {'enabled' if gil_enabled() else 'disabled'}"
+
+    def close(self) -> None:
+        """stop the workers, a new executor is created on the next use"""
+
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _get(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.threaded:
+                    self._executor = ThreadPoolExecutor(self.workers, "cpu")
+                else:
+                    # the download threads are running, forking them is not safe
+                    self._executor = ProcessPoolExecutor(
+                        self.workers,
+                        multiprocessing.get_context("spawn"),
+                        initializer=_ignore_sigint,
+                    )
+            return self._executor
+
+
+CPU = CpuPool()
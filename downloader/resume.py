@@ -0,0 +1,87 @@
+"""manifest of the pages of a chapter, used to resume interrupted downloads"""
+
+import os
+import json
+import threading
+from typing import Mapping
+
+
+class ChapterManifest:
+    """expected size and validator of the pages of a chapter
+    it is saved next to the partial archive so that an interrupted page can
+    be continued with a Range request and every page checked before zipping"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.pages: dict[str, dict] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, encoding="utf-8") as manifest_file:
+                    self.pages = json.load(manifest_file)
+            except (OSError, ValueError):
+                self.pages = {}
+
+    def record(self, page_str: str, status: int, headers: Mapping[str, str]) -> None:
+        """record the size and the validator announced by a page response"""
+
+        size = None
+        if status == 206 and "/" in headers.get("Content-Range", ""):
+            total = headers["Content-Range"].rsplit("/", 1)[1]
+            size = int(total) if total.isdigit() else None
+        elif "Content-Length" in headers and "Content-Encoding" not in headers:
+            size = int(headers["Content-Length"])
+
+        with self._lock:
+            self._load()
+            self.pages[page_str] = {
+                "size": size,
+                "validator": headers.get("ETag") or headers.get("Last-Modified") or "",
+            }
+
+    def range_headers(self, page_str: str, offset: int) -> dict[str, str]:
+        """return the headers continuing a page from offset, if it can be resumed"""
+
+        with self._lock:
+            self._load()
+            entry = self.pages.get(page_str)
+        if not offset or not entry or not entry["validator"]:
+            return {}
+        if entry["size"] is not None and offset >= entry["size"]:
+            return {}
+        return {"Range": f"bytes={offset}-", "If-Range": entry["validator"]}
+
+    def mismatches(self, sizes: dict[str, int]) -> list[str]:
+        """return the pages whose size differs from the announced one"""
+
+        with self._lock:
+            self._load()
+            return sorted(
+                page_str
+                for page_str, entry in self.pages.items()
+                if entry["size"] is not None and sizes.get(page_str) != entry["size"]
+            )
+
+    def save(self) -> None:
+        """write the manifest to disk"""
+
+        with self._lock:
+            if not self.pages:
+                return
+            with open(self.path + ".tmp", "w", encoding="utf-8") as manifest_file:
+                json.dump(self.pages, manifest_file)
+            os.replace(self.path + ".tmp", self.path)
+
+    def remove(self) -> None:
+        """delete the manifest"""
+
+        with self._lock:
+            self.pages = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
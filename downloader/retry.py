@@ -0,0 +1,129 @@
+"""retry of the failed pages and resolutions with exponential backoff"""
+
+import time
+import heapq
+import random
+import threading
+import itertools
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Callable
+
+
+def status_of(excp: BaseException) -> int:
+    """return the http status carried by an exception, 0 if there is none"""
+
+    response = getattr(excp, "response", None)
+    if response is not None and getattr(response, "status_code", None):
+        return response.status_code
+    return getattr(excp, "status", 0) or 0
+
+
+def retryable(excp: BaseException) -> bool:
+    """return True if the error may go away by trying again
+    client errors, such as a missing page, are final, and so are the errors
+    whose retryable attribute is False"""
+
+    if not getattr(excp, "retryable", True):
+        return False
+    status = status_of(excp)
+    return not (400 <= status < 500 and status not in (408, 425, 429))
+
+
+def retry_after(excp: BaseException) -> float:
+    """return the seconds asked by a Retry-After header, 0 if absent"""
+
+    response = getattr(excp, "response", None)
+    headers = getattr(response, "headers", None) or getattr(excp, "headers", None) or {}
+    value = headers.get("Retry-After", "")
+    if value.isdigit():
+        return float(value)
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return max((date - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class RetryPolicy:
+    """exponential backoff with full jitter, bounded by a number of attempts
+    for each page and by a budget of retries for each group of chapters, such
+    as a job of the daemon, the whole download by default"""
+
+    def __init__(
+        self, attempts: int = 4, base: float = 0.5, cap: float = 30.0, budget: int = 500
+    ) -> None:
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.budget = budget
+        self._spent: dict[object, int] = {}  # group -> retries allowed
+        self._lock = threading.Lock()
+
+    def allow(self, attempt: int, excp: BaseException, group: object = None) -> bool:
+        """return True, consuming the budget of group, if a failed attempt can be retried"""
+
+        if attempt + 1 >= self.attempts or not retryable(excp):
+            return False
+        with self._lock:
+            spent = self._spent.get(group, 0)
+            if spent >= self.budget:
+                return False
+            self._spent[group] = spent + 1
+            return True
+
+    def forget(self, group: object) -> None:
+        """drop the budget spent by a finished group"""
+
+        with self._lock:
+            self._spent.pop(group, None)
+
+    def delay(self, attempt: int, excp: BaseException) -> float:
+        """return the seconds to wait before the next attempt"""
+
+        backoff = random.uniform(0, min(self.cap, self.base * 2**attempt))
+        return max(backoff, min(retry_after(excp), self.cap))
+
+
+class RetryQueue:
+    """single thread calling the scheduled functions once their delay has elapsed"""
+
+    def __init__(self) -> None:
+        self._heap: list[tuple[float, int, Callable, tuple]] = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._closed = False
+
+    def schedule(self, delay: float, function: Callable, *args) -> None:
+        """call function(*args) in delay seconds"""
+
+        with self._condition:
+            due = time.monotonic() + delay
+            heapq.heappush(self._heap, (due, next(self._counter), function, args))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def close(self) -> None:
+        """stop the thread, pending calls are dropped"""
+
+        with self._condition:
+            self._closed = True
+            self._heap.clear()
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._closed and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._condition.wait(timeout)
+                if self._closed:
+                    return
+                _, _, function, args = heapq.heappop(self._heap)
+            function(*args)
+
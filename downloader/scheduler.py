@@ -0,0 +1,354 @@
+"""page-level scheduler shared across all the chapters of a download"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator
+from .archive import ChapterArchive
+from .resume import ChapterManifest
+from .retry import RetryPolicy, RetryQueue
+
+
+class ChapterJob:
+    """class containing the state of a chapter being downloaded"""
+
+    def __init__(self, chapter: dict, folder_path: str, manga: dict) -> None:
+        self.chapter = chapter
+        self.folder_path = folder_path
+        self.manga = manga
+        self.archive = ChapterArchive(self.zip_path)
+        self.manifest = ChapterManifest(self.zip_path + ".part.json")
+        self.error = ""
+        self.cancel: threading.Event | None = None  # set to give up the chapter
+        self.headers: dict[str, str] = {}  # sent with every page request
+        self.ranges = True  # partial pages are continued with Range requests
+        self.group: object = None  # chapters finishing together, e.g. a job of the daemon
+        self.stats = {
+            "resolve": 0.0,
+            "download": 0.0,
+            "zip": 0.0,
+            "encode": 0.0,
+            "bytes": 0,
+            "pages": 0,
+            "retries": 0,
+            "saved": 0,
+            "unencoded": 0,  # pages kept as served because their re-encoding failed
+        }
+        self._first_start = 0.0
+        self._last_end = 0.0
+        self._pending = 0
+        self._queued: set[str] = set()
+        self._resolved = False
+        self._finalized = False
+        self._final = False  # in its final pass, the chapter is not parked again
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        """name of the chapter"""
+
+        return self.chapter["name"]
+
+    @property
+    def zip_path(self) -> str:
+        """path of the archive of the chapter"""
+
+        return os.path.join(self.folder_path, self.name + ".cbz")
+
+    @property
+    def cancelled(self) -> bool:
+        """True if the chapter has been cancelled"""
+
+        return self.cancel is not None and self.cancel.is_set()
+
+    def request_headers(self, page_str: str) -> dict[str, str]:
+        """return the headers of the request of a page, continuing a partial one if possible"""
+
+        offset = self.archive.partial_size(page_str) if self.ranges else 0
+        return {**self.headers, **self.manifest.range_headers(page_str, offset)}
+
+    def record_page(self, start: float, end: float, size: int) -> None:
+        """record a page downloaded between the perf_counter times start and end"""
+
+        with self._lock:
+            if not self._first_start or start < self._first_start:
+                self._first_start = start
+            self._last_end = max(self._last_end, end)
+            self.stats["download"] = self._last_end - self._first_start
+            self.stats["bytes"] += size
+            self.stats["pages"] += 1
+
+    def record_stage(self, stage: str, seconds: float) -> None:
+        """add seconds to the duration of a stage of the chapter"""
+
+        with self._lock:
+            self.stats[stage] += seconds
+
+    def report(self) -> dict:
+        """return the record of the chapter for the metrics"""
+
+        with self._lock:
+            return {"manga": self.manga.get("name", ""), "name": self.name, **self.stats, "error": self.error}
+
+    def suspend(self) -> None:
+        """keep what has been downloaded so far to resume the chapter later"""
+
+        if self.archive.suspend():
+            self.manifest.save()
+
+    def fail(self, error: str) -> None:
+        """mark the chapter as failed, only the first error is kept"""
+
+        with self._lock:
+            if not self.error:
+                self.error = error
+
+    def record_retry(self) -> None:
+        """count a page or a resolution tried again"""
+
+        with self._lock:
+            self.stats["retries"] += 1
+
+    def _queue_page(self, page_str: str) -> bool:
+        """return False if the page was already queued by an earlier resolution"""
+
+        with self._lock:
+            if page_str in self._queued:
+                return False
+            self._queued.add(page_str)
+            self._pending += 1
+            return True
+
+    def _restart(self) -> None:
+        """reset the chapter for the final retry pass, landed pages are kept"""
+
+        with self._lock:
+            self.error = ""
+            self._pending = 0
+            self._queued = set()
+            self._resolved = False
+            self._finalized = False
+
+    def _page_landed(self) -> bool:
+        """return True if the chapter has to be finalized"""
+
+        with self._lock:
+            self._pending -= 1
+            return self._should_finalize()
+
+    def _resolution_done(self) -> bool:
+        """return True if the chapter has to be finalized"""
+
+        with self._lock:
+            self._resolved = True
+            return self._should_finalize()
+
+    def _should_finalize(self) -> bool:
+        if self._resolved and not self._pending and not self._finalized:
+            self._finalized = True
+            return True
+        return False
+
+
+class ChapterGroups:
+    """chapters in flight of each group and failing chapters waiting for their
+    final pass, which the chapters of a group get as soon as none of them is in
+    flight, the chapters without a group wait for the end of the download"""
+
+    def __init__(self, retry: RetryPolicy) -> None:
+        self.retry = retry
+        self._counts: dict[object, int] = {}
+        self._parked: list[ChapterJob] = []
+        self._lock = threading.Lock()
+
+    def enter(self, job: ChapterJob) -> None:
+        """count a chapter submitted"""
+
+        if job.group is not None:
+            with self._lock:
+                self._counts[job.group] = self._counts.get(job.group, 0) + 1
+
+    def park(self, job: ChapterJob) -> None:
+        """keep a failing chapter for its final pass"""
+
+        with self._lock:
+            self._parked.append(job)
+
+    def leave(self, job: ChapterJob) -> list[ChapterJob]:
+        """count a chapter finalized or parked, return the chapters of its group
+        to try a last time once none of them is in flight, they count as in flight"""
+
+        if job.group is None:
+            return []
+        with self._lock:
+            self._counts[job.group] -= 1
+            if self._counts[job.group]:
+                return []
+            restart = [parked for parked in self._parked if parked.group == job.group]
+            self._parked = [parked for parked in self._parked if parked.group != job.group]
+            if restart:
+                self._counts[job.group] = len(restart)
+            else:
+                del self._counts[job.group]
+                self.retry.forget(job.group)
+        for parked in restart:
+            parked._restart()
+            parked._final = True
+        return restart
+
+    def take(self) -> list[ChapterJob]:
+        """return and forget every parked chapter, for the end of the download"""
+
+        with self._lock:
+            parked, self._parked = self._parked, []
+        return parked
+
+
+class PageScheduler:
+    """scheduler that downloads the pages of every chapter on a single pool
+    the number of pages in flight is bounded, and a chapter is finalized
+    as soon as its last page lands
+    a failed page or resolution is tried again alone after a backoff, and the
+    chapters still failing get a last pass once everything else is done"""
+
+    def __init__(
+        self,
+        resolve: Callable[[ChapterJob], Iterator[tuple[str, str]]],
+        download: Callable[[ChapterJob, str, str], None],
+        finalize: Callable[[ChapterJob], None],
+        stopped: Callable[[], bool],
+        workers: int = 8,
+        max_in_flight: int = 32,
+        retry: RetryPolicy | None = None,
+    ) -> None:
+        self._resolve = resolve
+        self._download = download
+        self._finalize = finalize
+        self._stopped = stopped
+        self.retry = retry or RetryPolicy()
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        # resolvers only produce work and wait on the in flight bound,
+        # keeping them separated from the page workers avoids deadlocks
+        self._resolvers = ThreadPoolExecutor(workers, "resolver")
+        self._workers = ThreadPoolExecutor(workers, "page")
+        self._retries = RetryQueue()
+        self._idle = threading.Condition()
+        self._active = 0
+        self._groups = ChapterGroups(self.retry)
+        self._final_pass = False
+
+    def submit(self, job: ChapterJob) -> None:
+        """queue a chapter, its pages are scheduled once resolved"""
+
+        with self._idle:
+            self._active += 1
+        self._groups.enter(job)
+        self._resolvers.submit(self._resolve_chapter, job, 0)
+
+    def join(self) -> None:
+        """wait for every chapter to be finalized"""
+
+        self._wait_idle()
+        parked = self._groups.take()
+        self._final_pass = True
+        for job in parked:
+            if self._stopped():
+                self._finalize(job)
+            else:
+                job._restart()
+                self.submit(job)
+        self._wait_idle()
+
+        self._retries.close()
+        self._resolvers.shutdown(wait=True)
+        self._workers.shutdown(wait=True)
+
+    def _wait_idle(self) -> None:
+        with self._idle:
+            while self._active:
+                self._idle.wait()
+
+    def _complete(self, job: ChapterJob) -> None:
+        """finalize the chapter, or keep it for the final pass if it failed"""
+
+        restart = []
+        try:
+            if (
+                job.error
+                and not job.cancelled
+                and not job._final
+                and not self._final_pass
+                and not self._stopped()
+            ):
+                self._groups.park(job)
+            else:
+                self._finalize(job)
+        finally:
+            restart = self._groups.leave(job)
+            with self._idle:
+                self._active += len(restart) - 1
+                self._idle.notify_all()
+        for parked in restart:
+            self._resolvers.submit(self._resolve_chapter, parked, 0)
+
+    def _retry(self, job: ChapterJob, attempt: int, excp: Exception) -> bool:
+        """return True if the failed step can be scheduled again"""
+
+        if (
+            job.error
+            or job.cancelled
+            or self._stopped()
+            or not self.retry.allow(attempt, excp, job.group)
+        ):
+            return False
+        job.record_retry()
+        return True
+
+    def _resolve_chapter(self, job: ChapterJob, attempt: int) -> None:
+        try:
+            for page_str, image_link in self._resolve(job):
+                if job.error or job.cancelled or self._stopped():
+                    break
+                if not job._queue_page(page_str):
+                    continue
+                self._in_flight.acquire()
+                self._workers.submit(self._download_page, job, page_str, image_link, 0, True)
+        except Exception as excp:
+            if self._retry(job, attempt, excp):
+                delay = self.retry.delay(attempt, excp)
+                self._retries.schedule(
+                    delay, self._resolvers.submit, self._resolve_chapter, job, attempt + 1
+                )
+                return
+            job.fail(f"error type: {excp}")
+
+        if job._resolution_done():
+            self._complete(job)
+
+    def _download_page(
+        self, job: ChapterJob, page_str: str, image_link: str, attempt: int, bounded: bool
+    ) -> None:
+        error = None
+        try:
+            if not job.error and not job.cancelled and not self._stopped():
+                self._download(job, page_str, image_link)
+        except Exception as excp:
+            error = excp
+        finally:
+            if bounded:
+                self._in_flight.release()
+
+        if error is not None:
+            # the page stays pending, a retry does not hold an in flight slot
+            # since the resolvers may be waiting on them
+            if self._retry(job, attempt, error):
+                delay = self.retry.delay(attempt, error)
+                self._retries.schedule(
+                    delay, self._workers.submit, self._download_page,
+                    job, page_str, image_link, attempt + 1, False,
+                )
+                return
+            job.fail(f"error type: {error}")
+
+        if job._page_landed():
+            self._complete(job)
@@ -0,0 +1,75 @@
+"""integrity check of every archive of the library, with a quarantine for the corrupt ones"""
+
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterator
+from .archive import archive_problem
+from .parallel import CPU
+
+QUARANTINE = ".quarantine"
+
+
+def find_archives(folder: str) -> list[str]:
+    """return the archives of every manga folder of the library, sorted
+    hidden entries, such as the databases and the quarantine, are skipped"""
+
+    paths = []
+    try:
+        mangas = [entry for entry in os.scandir(folder) if entry.is_dir()]
+    except FileNotFoundError:
+        return []
+    for manga in mangas:
+        if manga.name.startswith("."):
+            continue
+        # a single listing of the folder, the archives are not opened here
+        paths.extend(
+            entry.path
+            for entry in os.scandir(manga.path)
+            if entry.name.endswith(".cbz") and entry.is_file()
+        )
+    return sorted(paths)
+
+
+def scrub(
+    folder: str,
+    progress: Callable[[int, int], None] | None = None,
+    stopped: Callable[[], bool] | None = None,
+) -> Iterator[tuple[str, str]]:
+    """yield the path and the problem of every corrupt archive of the library
+    the archives are checked on the cpu pool, progress(checked, total) is
+    called as the results come, and the check ends early once stopped"""
+
+    paths = find_archives(folder)
+    try:
+        for checked, (path, problem) in enumerate(
+            zip(paths, CPU.imap(archive_problem, paths)), start=1
+        ):
+            if stopped is not None and stopped():
+                return
+            if progress is not None:
+                progress(checked, len(paths))
+            if problem:
+                yield path, problem
+    except BrokenProcessPool:
+        # a worker died, killed with the terminal for instance, the pool is
+        # created again on its next use
+        CPU.close()
+        if stopped is not None and stopped():
+            return
+        raise
+
+
+def quarantine(zip_path: str, folder: str) -> str:
+    """move a corrupt archive out of its manga folder into the quarantine of
+    the library, keeping the folder of its manga, return its new path"""
+
+    manga_name = os.path.basename(os.path.dirname(zip_path))
+    target_folder = os.path.join(folder, QUARANTINE, manga_name)
+    os.makedirs(target_folder, exist_ok=True)
+    target = os.path.join(target_folder, os.path.basename(zip_path))
+    if os.path.exists(target):
+        # an archive quarantined by an earlier scrub is kept too
+        target = f"{target[:-len('.cbz')]}.{int(time.time())}.cbz"
+    os.replace(zip_path, target)
+    return target
@@ -0,0 +1,215 @@
+"""pooled keep-alive http sessions shared by the adapters and the downloader"""
+
+import time
+import threading
+from typing import TYPE_CHECKING, Iterator
+from urllib.parse import urlsplit
+from .metrics import METRICS
+from .concurrency import CONCURRENCY, FAILED, THROTTLED, HostLimiter, outcome_of
+from .bandwidth import BANDWIDTH
+
+if TYPE_CHECKING:
+    import requests
+
+# connections are opened in the thread sending the request, their timings
+# are handed to the request through this thread local
+CONNECT = threading.local()
+
+
+class SessionPool:
+    """thread-safe collection of keep-alive sessions, one for each host"""
+
+    def __init__(self, pool_connections: int = 4, pool_maxsize: int = 16) -> None:
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._sessions: dict[str, "requests.Session"] = {}
+        self._requests: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, pool_connections: int = 0, pool_maxsize: int = 0) -> None:
+        """change the pool sizes, open sessions are closed and recreated lazily"""
+
+        with self._lock:
+            self.pool_connections = pool_connections or self.pool_connections
+            self.pool_maxsize = pool_maxsize or self.pool_maxsize
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+    def session(self, url: str) -> "requests.Session":
+        """return the session of the host of the url"""
+
+        host = urlsplit(url).netloc
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                # requests is slow to import, it is loaded with the first session
+                import requests
+                from .transport import PoolAdapter
+
+                session = requests.Session()
+                adapter = PoolAdapter(
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=self.pool_maxsize,
+                    pool_block=False,
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[host] = session
+                self._requests[host] = 0
+            self._requests[host] += 1
+        return session
+
+    def get(self, url: str, **kwargs) -> "requests.Response":
+        """send a GET request through the session of the host
+        the request waits for a slot of the host in CONCURRENCY and is recorded
+        in METRICS, a streamed one holds its slot and is recorded until its body
+        is consumed through iter_content or the response is closed"""
+
+        host = urlsplit(url).netloc
+        limiter = CONCURRENCY.host(url)
+        limiter.acquire()
+        CONNECT.timings = {}
+        start = time.perf_counter()
+        try:
+            response = self.session(url).get(url, **kwargs)
+        except Exception as excp:
+            limiter.release(0, THROTTLED if _timed_out(excp) else FAILED)
+            METRICS.record_request(
+                host=host,
+                url=url,
+                status=0,
+                ttfb=time.perf_counter() - start,
+                error=str(excp),
+                **CONNECT.timings,
+            )
+            raise
+
+        timings = dict(CONNECT.timings)
+        timings["ttfb"] = max(
+            response.elapsed.total_seconds()
+            - sum(timings.get(key, 0) for key in ("dns", "connect", "tls")),
+            0,
+        )
+        response.timings = timings
+        if kwargs.get("stream"):
+            _hold_slot(response, limiter, host, timings)
+        else:
+            limiter.release(timings["ttfb"], outcome_of(response.status_code))
+            METRICS.record_request(
+                host=host,
+                url=url,
+                status=response.status_code,
+                transfer=max(time.perf_counter() - start - response.elapsed.total_seconds(), 0),
+                bytes=len(response.content),
+                error="",
+                **timings,
+            )
+        return response
+
+    def iter_content(self, response: "requests.Response", chunk_size: int) -> Iterator[bytes]:
+        """iterate over a streamed body, no faster than BANDWIDTH allows,
+        recording the request once consumed"""
+
+        host = urlsplit(response.url).netloc
+        # the request is recorded by timed_chunks rather than on close
+        response.consumed = True
+
+        def chunks() -> Iterator[bytes]:
+            release = getattr(response, "release_slot", None)
+            try:
+                yield from BANDWIDTH.limited(host, response.iter_content(chunk_size))
+            except Exception as excp:
+                if release is not None:
+                    release(THROTTLED if _timed_out(excp) else FAILED)
+                raise
+            if release is not None:
+                release(outcome_of(response.status_code))
+
+        return METRICS.timed_chunks(
+            host,
+            response.url,
+            response.status_code,
+            getattr(response, "timings", {}),
+            chunks(),
+        )
+
+    def stats(self) -> dict[str, tuple[int, int]]:
+        """return, for each host, the number of requests and of opened connections"""
+
+        output = {}
+        with self._lock:
+            for host, session in self._sessions.items():
+                adapter = session.get_adapter("https://")
+                output[host] = (self._requests[host], adapter.connections)
+        return output
+
+    def summary(self) -> str:
+        """return a printable summary of the connection reuse"""
+
+        stats = self.stats()
+        total_requests = sum(entry[0] for entry in stats.values())
+        total_connections = sum(entry[1] for entry in stats.values())
+        return (
+            f"{total_requests} requests over {total_connections} connections"
+            f" ({max(total_requests - total_connections, 0)} reused)"
+        )
+
+    def close(self) -> None:
+        """close every session"""
+
+        self.configure()
+
+
+def _timed_out(excp: BaseException) -> bool:
+    """return True if the exception comes from a timeout"""
+
+    import requests
+
+    if isinstance(excp, requests.Timeout):
+        return True
+    # requests wraps the read timeouts of a streamed body in a ConnectionError
+    return any("timed out" in str(arg).lower() for arg in excp.args)
+
+
+def _hold_slot(
+    response: "requests.Response", limiter: HostLimiter, host: str, timings: dict
+) -> None:
+    """keep the slot of a streamed response until its body is consumed or closed,
+    a response closed without going through iter_content, such as an error
+    status raised by raise_for_status, is recorded in METRICS on close"""
+
+    lock = threading.Lock()
+    released = []
+
+    def release_slot(outcome: str) -> None:
+        with lock:
+            if released:
+                return
+            released.append(outcome)
+        limiter.release(timings["ttfb"], outcome)
+
+    close = response.close
+
+    def close_and_release() -> None:
+        close()
+        release_slot(outcome_of(response.status_code))
+        if getattr(response, "consumed", False):
+            return
+        response.consumed = True
+        status = response.status_code
+        METRICS.record_request(
+            host=host,
+            url=response.url,
+            status=status,
+            transfer=0,
+            bytes=0,
+            error=f"{status} {response.reason}" if status >= 400 else "closed unread",
+            **timings,
+        )
+
+    response.release_slot = release_slot
+    response.close = close_and_release
+
+
+SESSIONS = SessionPool()
@@ -0,0 +1,84 @@
+"""requests adapter counting and timing the connections it opens
+kept apart from sessions, requests is only imported with the first session"""
+
+import time
+import socket
+import threading
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPConnectionPool, HTTPSConnectionPool
+from .sessions import CONNECT
+
+
+class PoolAdapter(HTTPAdapter):
+    """http adapter that counts the connections actually opened"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.connections = 0
+        self._lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool(HTTPConnectionPool, self),
+            "https": _counting_pool(HTTPSConnectionPool, self),
+        }
+
+    def connected(self) -> None:
+        """register a new connection"""
+
+        with self._lock:
+            self.connections += 1
+
+
+def _counting_pool(pool_cls: type, adapter: PoolAdapter) -> type:
+    """return a subclass of pool_cls whose connections notify the adapter"""
+
+    class Connection(pool_cls.ConnectionCls):
+        """connection that notifies the adapter when connecting
+        and times the name resolution, the tcp connection and the tls handshake"""
+
+        def _new_conn(self) -> socket.socket:
+            start = time.perf_counter()
+            host = self._dns_host
+            try:
+                address = socket.getaddrinfo(host, self.port, type=socket.SOCK_STREAM)[0][4][0]
+            except OSError:
+                address = host
+            resolved = time.perf_counter()
+
+            self._dns_host = address
+            try:
+                sock = super()._new_conn()
+            except Exception:
+                if address == host:
+                    raise
+                # let urllib3 try every address of the host
+                self._dns_host = host
+                sock = super()._new_conn()
+            finally:
+                self._dns_host = host
+
+            CONNECT.timings = {
+                "dns": resolved - start,
+                "connect": time.perf_counter() - resolved,
+            }
+            return sock
+
+        def connect(self) -> None:
+            start = time.perf_counter()
+            CONNECT.timings = {}
+            super().connect()
+            timings = CONNECT.timings
+            timings["tls"] = max(
+                time.perf_counter() - start - timings.get("dns", 0) - timings.get("connect", 0),
+                0,
+            )
+            adapter.connected()
+
+    class Pool(pool_cls):
+        """pool using the notifying connections"""
+
+        ConnectionCls = Connection
+
+    return Pool
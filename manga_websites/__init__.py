@@ -1,21 +1,80 @@
-"""collection of manga websites and their functions"""
+"""collection of manga websites and their functions
+the adapters are imported and instantiated on first use, the urls are matched
+against the static table below without loading any of them"""
 
-##### add to here
-from .mangalife import Mangalife
-from .batoto import Batoto
+import threading
+from importlib import import_module
+from typing import Iterator, Mapping
+from .selection import Selection
+from .adapter import (
+    API_VERSION,
+    Chapter,
+    Manga,
+    Page,
+    Capabilities,
+    AdapterError,
+    ChapterNotFound,
+    SiteUnavailable,
+    LayoutChanged,
+    capabilities_of,
+    resolve,
+)
 
-mangas = (Mangalife, Batoto)
+##### add to here
+# name -> (module, class, page the urls of the website start with)
+WEBSITES = {
+    "mangalife": ("mangalife", "Mangalife", "https://www.manga4life.com"),
+    "batoto": ("batoto", "Batoto", "https://battwo.com"),
+}
 #####
 
 
-def create_manga_dict(timeout: int) -> dict:
-    """return a list of mangas instances"""
-    return {class_manga.name: class_manga(timeout) for class_manga in mangas}
+def load_website(name: str) -> type:
+    """import and return the adapter class of the website, with the page of the table"""
+
+    module, class_name, page = WEBSITES[name]
+    class_manga = getattr(import_module(f".{module}", __name__), class_name)
+    class_manga.page = page
+    return class_manga
+
+
+class Websites(Mapping):
+    """name -> adapter instance, each adapter is created on its first access"""
+
+    def __init__(self, timeout: int) -> None:
+        self.timeout = timeout
+        self._instances: dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str):
+        with self._lock:
+            if name not in self._instances:
+                self._instances[name] = load_website(name)(self.timeout)
+            return self._instances[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(WEBSITES)
+
+    def __len__(self) -> int:
+        return len(WEBSITES)
+
+
+def create_manga_dict(timeout: int) -> Websites:
+    """return the mapping of the website names to their lazily created instances"""
+    return Websites(timeout)
 
 
 def get_manga_website(url: str) -> str:
     """identify manga website from the url"""
-    for class_manga in mangas:
-        if url.startswith(class_manga.page):
-            return class_manga.name
+    for name, (_, _, page) in WEBSITES.items():
+        if url.startswith(page):
+            return name
     return ""
+
+
+def __getattr__(name: str) -> type:
+    # the adapter classes stay importable by name, e.g. from manga_websites import Batoto
+    for website, (_, class_name, _) in WEBSITES.items():
+        if class_name == name:
+            return load_website(website)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,112 @@
+"""version 2 of the interface of the website adapters
+typed records of the mangas, chapters and pages, structured errors and the
+capabilities a website declares to the downloader, see template.py"""
+
+from typing import Iterable, Iterator, NamedTuple, TypedDict
+
+API_VERSION = 2
+
+
+class Chapter(TypedDict, total=False):
+    """chapter of a manga, adapters can add keys for their own use"""
+
+    name: str  # also the name of the archive
+    number: float | None  # for the chapter selection, None when unknown
+    volume: int | None
+    url: str
+
+
+class Manga(TypedDict, total=False):
+    """manga returned by create_manga, adapters can add keys for their own use"""
+
+    website: str
+    name: str
+    url: str  # the one given to create_manga
+    list_chapters: list[Chapter]
+
+
+class Page(NamedTuple):
+    """page of a chapter, number is formatted to sort in reading order"""
+
+    number: str
+    url: str
+
+
+class Capabilities:
+    """what a website supports, read by the downloader to schedule its pages"""
+
+    def __init__(
+        self,
+        concurrency: int = 0,
+        ranges: bool = False,
+        page_count: bool = False,
+        headers: dict[str, str] | None = None,
+        referer: bool = False,
+    ) -> None:
+        self.concurrency = concurrency  # requests in flight tolerated by each host, 0 if unbounded
+        self.ranges = ranges  # partial pages can be continued with Range requests
+        self.page_count = page_count  # resolve_pages knows every page of a chapter at once
+        self.headers = headers or {}  # sent with every page request
+        self.referer = referer  # the page requests come from the page of the website
+
+    def request_headers(self, page: str) -> dict[str, str]:
+        """return the headers of the page requests of the website at page, the
+        page listed in WEBSITES"""
+
+        if not self.referer:
+            return self.headers
+        return {"Referer": page + "/", **self.headers}
+
+
+class AdapterError(Exception):
+    """error of a website adapter, retryable tells if trying again may help"""
+
+    retryable = True
+
+
+class ChapterNotFound(AdapterError):
+    """the chapter does not exist on the website"""
+
+    retryable = False
+
+
+class SiteUnavailable(AdapterError):
+    """the website answered without the expected content, e.g. a challenge page"""
+
+
+class LayoutChanged(AdapterError):
+    """the page of the website does not have the expected structure"""
+
+    retryable = False
+
+
+def capabilities_of(adapter: object) -> Capabilities:
+    """return the capabilities of an adapter, the defaults for a version 1 one"""
+
+    return getattr(adapter, "capabilities", None) or Capabilities()
+
+
+def resolve(adapter: object, chapter: Chapter, manga: Manga) -> Iterable[Page]:
+    """return the pages of the chapter, for an adapter of any version
+    an adapter knowing the page count must return at least one page"""
+
+    if getattr(adapter, "api_version", 1) < 2:
+        return _from_generator(adapter.img_generator(chapter, manga))
+
+    pages = (Page(*page) for page in adapter.resolve_pages(chapter, manga))
+    if not capabilities_of(adapter).page_count:
+        return pages
+    pages = list(pages)
+    if not pages:
+        raise LayoutChanged("no page found in the chapter")
+    return pages
+
+
+def _from_generator(pages: Iterator[tuple[str, str]]) -> Iterator[Page]:
+    """convert the pages of a version 1 generator, where an empty page number
+    carries an error message in place of the url"""
+
+    for page_str, url in pages:
+        if not page_str:
+            raise AdapterError(url)
+        yield Page(page_str, url)
@@ -1,9 +1,52 @@
 """collection of manga websites and their attributes"""
 
 import re
-import ast
-from typing import Iterator
-import requests
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable
+from downloader import SESSIONS, CPU
+from .extract import extract
+from .adapter import API_VERSION, Capabilities, Chapter, LayoutChanged, Manga, Page, SiteUnavailable
+
+
+class _Cancelled(Exception):
+    """the search has been superseded by a newer one"""
+
+
+def _wait(future: Future, cancelled: Callable[[], bool] | None) -> str:
+    """wait for a page of results, giving up as soon as the search is cancelled"""
+
+    while True:
+        if cancelled is not None and cancelled():
+            future.cancel()
+            raise _Cancelled
+        try:
+            return future.result(timeout=0.05)
+        except FutureTimeout:
+            pass
+
+
+def _parse_manga(html: str) -> tuple[str | None, list[tuple[str, str]]]:
+    """return the name and the (url, name) chapters of a manga page"""
+
+    name_group = re.search(r"<title>(.*?) Manga</title>", html)
+    list_chapters = re.findall(r'<a class=".*?" href="(.*?)" >\s*<b>(.*?)</b>', html)
+    return (name_group.group(1) if name_group else None), list_chapters
+
+
+def _numbers(chapter_name: str) -> dict[str, float | int | None]:
+    """return the chapter number and the volume written in a chapter name,
+    such as "Vol.2 Chapter 12.5" """
+
+    volume = re.search(r"vol(?:ume)?\.?\s*(\d+)", chapter_name, re.IGNORECASE)
+    number = re.search(r"ch(?:apter)?\.?\s*(\d+(?:\.\d+)?)", chapter_name, re.IGNORECASE)
+    if number is None:
+        number = re.search(r"(\d+(?:\.\d+)?)(?!.*\d)", chapter_name)
+    return {
+        "number": float(number.group(1)) if number else None,
+        "volume": int(volume.group(1)) if volume else None,
+    }
 
 
 class Batoto:
@@ -11,107 +54,137 @@ class Batoto:
 
     name = "batoto"
     page = "https://battwo.com"
+    api_version = API_VERSION
+    # the image servers expect to be browsed from the website
+    capabilities = Capabilities(concurrency=8, ranges=True, page_count=True, referer=True)
 
     def __init__(self, timeout: int) -> None:
         self.timeout = timeout
+        self.cache_size = 128
+        self._cache: OrderedDict[str, tuple[list[tuple[str, str]], bool]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool: ThreadPoolExecutor | None = None
 
     def load_database(self) -> None:
         """load the database of mangas"""
 
-    def print_list(self, word_search: str, max_len: int = 100) -> list[tuple[str, str]]:
-        """return list of mangas"""
-
-        pattern = r'<a class="item-title" href="(.*?)" >(.*?)</a>'
+    def print_list(
+        self,
+        word_search: str,
+        max_len: int = 100,
+        cancelled: Callable[[], bool] | None = None,
+    ) -> list[tuple[str, str]]:
+        """return list of mangas
+        results are cached, and the search stops as soon as cancelled returns True"""
+
+        with self._lock:
+            cached = self._cache.get(word_search)
+            if cached is not None and (len(cached[0]) >= max_len or cached[1]):
+                self._cache.move_to_end(word_search)
+                return cached[0][:max_len]
 
-        search_list: list[str] = []
-
-        page_number = 1
-        page_text = ""
-
-        while len(search_list) < max_len:
-            if page_number == 1:
-                response = requests.get(
-                    self.page + f"/search?word={word_search}",
-                    timeout=self.timeout,
-                )
-            else:
-                # at this point page_text is the previous html and page_number the next page number
-                if f"page={page_number}" not in page_text:
-                    break
-                response = requests.get(
-                    self.page + f"/search?word={word_search}&page={page_number}",
-                    timeout=self.timeout,
-                )
-
-            page_text = response.text
-
-            new_list = re.findall(pattern, page_text)
-            if not new_list:
-                break
-            search_list.extend(new_list)
-            page_number += 1
+        try:
+            search_list, complete = self._search(word_search, max_len, cancelled)
+        except _Cancelled:
+            return []
 
-        return [
+        output = [
             (
                 entry[1]
                 .replace(r'<span class="highlight-text">', "")
                 .replace(r"</span>", ""),
                 self.page + entry[0],
             )
-            for entry in search_list[:max_len]
+            for entry in search_list
         ]
 
-    def create_manga(self, url_manga: str) -> dict[str, str | list[dict]]:
+        with self._lock:
+            self._cache[word_search] = (output, complete)
+            self._cache.move_to_end(word_search)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return output[:max_len]
+
+    def _search(
+        self, word_search: str, max_len: int, cancelled: Callable[[], bool] | None
+    ) -> tuple[list[tuple[str, str]], bool]:
+        """return the results and whether they are all the results of the search
+        page 1 tells how many pages exist, the following ones are fetched in parallel"""
+
+        pattern = r'<a class="item-title" href="(.*?)" >(.*?)</a>'
+
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(4, "batoto-search")
+
+        def fetch(page_number: int) -> str:
+            url = self.page + f"/search?word={word_search}"
+            if page_number > 1:
+                url += f"&page={page_number}"
+            return SESSIONS.get(url, timeout=self.timeout).text
+
+        page_text = _wait(self._pool.submit(fetch, 1), cancelled)
+        search_list = re.findall(pattern, page_text)
+        if not search_list:
+            return [], True
+
+        last_page = max(
+            (int(number) for number in re.findall(r"[?&]page=(\d+)", page_text)),
+            default=1,
+        )
+        needed = min(last_page, -(-max_len // len(search_list)))
+
+        futures = [
+            self._pool.submit(fetch, page_number) for page_number in range(2, needed + 1)
+        ]
+        try:
+            for future in futures:
+                new_list = re.findall(pattern, _wait(future, cancelled))
+                if not new_list:
+                    return search_list, True
+                search_list.extend(new_list)
+        finally:
+            for future in futures:
+                future.cancel()
+
+        return search_list, needed >= last_page
+
+    def create_manga(self, url_manga: str) -> Manga:
         """create manga dictionary with various attributes"""
 
         if not url_manga:
             return {}
 
-        response = requests.get(url_manga, timeout=self.timeout)
-        html_string = response.text
+        response = SESSIONS.get(url_manga, timeout=self.timeout)
+        response.raise_for_status()
 
-        list_chapters = re.findall(
-            r'<a class=".*?" href="(.*?)" >\s*<b>(.*?)</b>', html_string
-        )
+        name, list_chapters = CPU.run(_parse_manga, response.text)
+        if name is None:
+            raise LayoutChanged("manga name not found")
         list_chapters = [
-            {"url": self.page + chapter[0], "name": chapter[1]}
+            {"url": self.page + chapter[0], "name": chapter[1], **_numbers(chapter[1])}
             for chapter in list_chapters
         ]
 
-        name_group = re.search(r"<title>(.*?) Manga</title>", html_string)
-        assert name_group is not None
-        name = name_group.group(1)
-
         manga = {
             "website": "batoto",
             "name": name,
+            "url": url_manga,
             "list_chapters": list_chapters,
         }
 
         return manga
 
-    def img_generator(
-        self, chapter: dict, manga: dict[str, str | list[dict]]
-    ) -> Iterator[tuple[str, str]]:
-        """create a generator for pages in chapter"""
+    def resolve_pages(self, chapter: Chapter, manga: Manga) -> list[Page]:
+        """return the pages of the chapter, listed in its imgHttps array"""
 
-        chapter_url = chapter["url"]
+        response = SESSIONS.get(chapter["url"], timeout=self.timeout)
+        response.raise_for_status()
 
-        stop = False
-        try:
-            response = requests.get(chapter_url, timeout=self.timeout)
-        except Exception as excp:
-            yield "", str(excp)
-            stop = True
-
-        if not stop:
-            html_string = response.text
-            pages_group = re.search(r"const imgHttps = (.*?);", html_string)
-            if not pages_group:
-                yield "", "website cannot be reached"
-            else:
-                pages_string = pages_group.group(1)
-                images = ast.literal_eval(pages_string)
-
-                for page_number, image_link in enumerate(images):
-                    yield f"{page_number:03d}", image_link
+        images = CPU.run(extract, response.text, "const imgHttps = ")
+        if images is None:
+            raise SiteUnavailable("website cannot be reached")
+        return [
+            Page(f"{page_number:03d}", image_link)
+            for page_number, image_link in enumerate(images)
+        ]
@@ -0,0 +1,90 @@
+"""on-disk cache of the manga directories of the websites"""
+
+import os
+import json
+import time
+
+SEPARATOR = "\x1f"
+
+
+def cache_folder() -> str:
+    """return the folder of the cache, following XDG_CACHE_HOME"""
+
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "another_manga_downloader")
+
+
+class DirectoryCache:
+    """columnar cache of a directory of (url, title) entries
+    the file is a json header line followed by the two columns, each one a
+    single string joined by a separator, so that loading is a couple of splits"""
+
+    def __init__(self, name: str, ttl: int = 24 * 3600) -> None:
+        self.path = os.path.join(cache_folder(), name + ".directory")
+        self.ttl = ttl
+        self.header: dict = {}
+
+    def load(self) -> list[tuple[str, str]] | None:
+        """return the cached entries, None if there is no usable cache"""
+
+        try:
+            with open(self.path, "rb") as cache_file:
+                self.header = json.loads(cache_file.readline())
+                body = cache_file.read().decode()
+        except (OSError, ValueError):
+            self.header = {}
+            return None
+
+        urls, _, titles = body.partition("\n")
+        if not urls:
+            return []
+        urls_list = urls.split(SEPARATOR)
+        titles_list = titles.split(SEPARATOR)
+        if len(urls_list) != len(titles_list):
+            self.header = {}
+            return None
+        return list(zip(urls_list, titles_list))
+
+    def stale(self) -> bool:
+        """return True if the cache is older than its time to live"""
+
+        return time.time() - self.header.get("fetched", 0) > self.ttl
+
+    def validators(self) -> dict[str, str]:
+        """return the headers revalidating the cached directory"""
+
+        headers = {}
+        if self.header.get("etag"):
+            headers["If-None-Match"] = self.header["etag"]
+        if self.header.get("last_modified"):
+            headers["If-Modified-Since"] = self.header["last_modified"]
+        return headers
+
+    def save(self, entries: list[tuple[str, str]], etag: str, last_modified: str) -> None:
+        """write the entries to the cache"""
+
+        self.header = {"fetched": time.time(), "etag": etag, "last_modified": last_modified}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".tmp", "wb") as cache_file:
+            cache_file.write(json.dumps(self.header).encode() + b"\n")
+            cache_file.write(SEPARATOR.join(entry[0] for entry in entries).encode())
+            cache_file.write(b"\n")
+            cache_file.write(SEPARATOR.join(entry[1] for entry in entries).encode())
+        os.replace(self.path + ".tmp", self.path)
+
+    def touch(self) -> None:
+        """mark the cached directory as fresh after a successful revalidation"""
+
+        self.header["fetched"] = time.time()
+        try:
+            with open(self.path, "rb") as cache_file:
+                cache_file.readline()
+                body = cache_file.read()
+            with open(self.path + ".tmp", "wb") as cache_file:
+                cache_file.write(json.dumps(self.header).encode() + b"\n")
+                cache_file.write(body)
+            os.replace(self.path + ".tmp", self.path)
+        except OSError:
+            pass
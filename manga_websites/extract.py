@@ -0,0 +1,60 @@
+"""extraction of the javascript data embedded in the html of the websites"""
+
+import json
+from typing import Any, Iterator
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+def _skip(text: str, index: int) -> int:
+    """return the first index at or after index that is not whitespace"""
+
+    while index < len(text) and text[index] in _WHITESPACE:
+        index += 1
+    return index
+
+
+def _locate(text: str, marker: str) -> int:
+    """return the index where the value assigned after marker starts, -1 if missing"""
+
+    index = text.find(marker)
+    if index < 0:
+        return -1
+    return _skip(text, index + len(marker))
+
+
+def extract(text: str, marker: str) -> Any:
+    """decode the json value that follows marker, None if marker is missing
+    the decoder finds the end of the value by itself, so string contents such
+    as ';' cannot cut it short"""
+
+    index = _locate(text, marker)
+    if index < 0:
+        return None
+    value, _ = _DECODER.raw_decode(text, index)
+    return value
+
+
+def iter_array(text: str, marker: str) -> Iterator[Any]:
+    """lazily decode the entries of the json array that follows marker"""
+
+    index = _locate(text, marker)
+    if index < 0:
+        return
+    if text[index : index + 1] != "[":
+        raise ValueError(f"{marker!r} is not followed by an array")
+
+    index = _skip(text, index + 1)
+    if text[index : index + 1] == "]":
+        return
+    while True:
+        value, index = _DECODER.raw_decode(text, index)
+        yield value
+        index = _skip(text, index)
+        separator = text[index : index + 1]
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"malformed array after {marker!r}")
+        index = _skip(text, index + 1)
@@ -1,10 +1,35 @@
 """collection of manga websites and their attributes"""
 
 import re
-import ast
-from typing import Iterator
-from itertools import islice
-import requests
+import threading
+from typing import Callable
+from downloader import SESSIONS, CPU
+from .cache import DirectoryCache
+from .extract import extract, iter_array
+from .search import TitleIndex
+from .adapter import (
+    API_VERSION,
+    Capabilities,
+    Chapter,
+    ChapterNotFound,
+    LayoutChanged,
+    Manga,
+    Page,
+    SiteUnavailable,
+)
+
+
+def _parse_directory(html: str) -> list[tuple[str, str]]:
+    """return the sorted (url, title) entries of the directory page"""
+
+    # decoded lazily, only the url and the title of each entry are kept
+    return sorted((entry["i"], entry["s"]) for entry in iter_array(html, "vm.Directory = "))
+
+
+def _parse_chapter_page(html: str) -> tuple[str | None, dict | None]:
+    """return the image server and the chapter data of a chapter page"""
+
+    return extract(html, "vm.CurPathName = "), extract(html, "vm.CurChapter = ")
 
 
 class Mangalife:
@@ -12,137 +37,171 @@ class Mangalife:
 
     name = "mangalife"
     page = "https://www.manga4life.com"
+    api_version = API_VERSION
+    # vm.CurChapter tells the number of pages, the images are static files
+    capabilities = Capabilities(concurrency=16, ranges=True, page_count=True)
 
     def __init__(self, timeout: int) -> None:
-        self.list_mangas: list[str] = []
+        self.list_mangas: list[tuple[str, str, str]] = []
         self.timeout = timeout
+        self.cache = DirectoryCache(self.name)
+        self.index: TitleIndex | None = None
+        self._indexed: list[tuple[str, str, str]] = []
 
     def load_database(self) -> None:
-        """load the database of mangas"""
+        """load the database of mangas
+        a cached directory is used right away and revalidated in the background"""
 
-        print("Downloading mangalife database")
-        response = requests.get(self.page + "/search/", timeout=self.timeout)
+        entries = self.cache.load()
+        if entries is not None:
+            self._set_directory(entries)
+            if self.cache.stale():
+                threading.Thread(target=self._refresh_quietly, daemon=True).start()
+            return
 
-        if response.status_code != 200:
+        print("Downloading mangalife database")
+        try:
+            self.refresh_database()
+        except Exception:
             print("Cannot reach mangalife server.")
-            response.raise_for_status()
+            raise
 
-        page_text = response.text
-        list_mangas_group = re.search(r"vm.Directory = (.*);", page_text)
-        assert list_mangas_group is not None
-        list_mangas = (
-            list_mangas_group.group(1)
-            .replace("null", "None")
-            .replace("false", "False")
-            .replace("true", "True")
+    def refresh_database(self) -> None:
+        """download the directory, unless the cached one is still valid"""
+
+        response = SESSIONS.get(
+            self.page + "/search/", timeout=self.timeout, headers=self.cache.validators()
         )
-        list_mangas = ast.literal_eval(list_mangas)
-        list_mangas = [
-            (entry["i"], entry["s"], entry["s"].lower()) for entry in list_mangas
-        ]
-        # first entry-url, second entry-display, third entry-search
-        list_mangas.sort()
-        self.list_mangas = list_mangas
 
-    def print_list(self, word_search: str, max_len: int = 100) -> list[tuple[str, str]]:
-        """return list of mangas"""
+        if response.status_code == 304:
+            self.cache.touch()
+            return
+
+        response.raise_for_status()
+
+        # the parsing runs on the cpu pool, out of the GIL of the other threads
+        entries = CPU.run(_parse_directory, response.text)
+        if not entries:
+            raise ValueError("mangalife directory not found")
+        self.cache.save(
+            entries,
+            response.headers.get("ETag", ""),
+            response.headers.get("Last-Modified", ""),
+        )
+        self._set_directory(entries)
+
+    def _refresh_quietly(self) -> None:
+        """refresh the database from a background thread"""
 
-        word_search_patter = word_search.lower().replace(" ", r".*?")
         try:
-            re.compile(word_search_patter)
-        except re.error:
-            search_iter = (
-                entry for entry in self.list_mangas if word_search in entry[2]
-            )
-        else:
-            search_iter = (
-                entry
-                for entry in self.list_mangas
-                if re.search(word_search_patter, entry[2])
-            )
+            self.refresh_database()
+        except Exception:
+            pass
 
-        search_list = list(islice(search_iter, max_len))
-        return [(entry[1], self.page + "/manga/" + entry[0]) for entry in search_list]
+    def _set_directory(self, entries: list[tuple[str, str]]) -> None:
+        """set the list of mangas from the (url, title) entries"""
 
-    def create_manga(self, url_manga: str) -> dict[str, str | list[dict]]:
+        # first entry-url, second entry-display, third entry-search
+        self.list_mangas = [(url, title, title.lower()) for url, title in entries]
+
+    def print_list(
+        self,
+        word_search: str,
+        max_len: int = 100,
+        cancelled: Callable[[], bool] | None = None,
+    ) -> list[tuple[str, str]]:
+        """return list of mangas, the local search is never cancelled"""
+
+        # the directory can be replaced by a background refresh
+        list_mangas = self.list_mangas
+        if self.index is None or self._indexed is not list_mangas:
+            self.index = TitleIndex([entry[2] for entry in list_mangas])
+            self._indexed = list_mangas
+        index = self.index
+
+        return [
+            (list_mangas[position][1], self.page + "/manga/" + list_mangas[position][0])
+            for position in index.search(word_search, max_len)
+        ]
+
+    def create_manga(self, url_manga: str) -> Manga:
         """create manga dictionary with various attributes"""
 
         if not url_manga:
             return {}
 
-        response = requests.get(url_manga, timeout=self.timeout)
+        response = SESSIONS.get(url_manga, timeout=self.timeout)
+        response.raise_for_status()
 
         html_string = response.text
         name_group = re.search(r"<title>(.*?) \| MangaLife</title>", html_string)
-        assert name_group is not None
+        if name_group is None:
+            raise LayoutChanged("manga name not found")
         name = name_group.group(1)
 
-        chapters_group = re.search(r"vm.Chapters = (.*?);", html_string)
-        assert chapters_group is not None
-        chapters_string = chapters_group.group(1).replace("null", "None")
-
-        list_chapters = ast.literal_eval(chapters_string)
+        list_chapters = CPU.run(extract, html_string, "vm.Chapters = ")
+        if list_chapters is None:
+            raise LayoutChanged("list of chapters not found")
         for chapter in list_chapters:
+            # "1" index, "0012" chapter and "5" decimal for chapter 12.5, the
+            # index tells the series, not the volume, which the website does not give
             chapter["name"] = chapter["Chapter"]
+            chapter["number"] = int(chapter["name"][1:-1]) + int(chapter["name"][-1]) / 10
+            chapter["volume"] = None
 
         manga = {
             "website": "mangalife",
             "name": name,
+            "url": url_manga,
             "list_chapters": list_chapters,
             "true name": url_manga.split("/")[-1],
         }
 
         return manga
 
-    def img_generator(
-        self, chapter: dict, manga: dict[str, str | list[dict]]
-    ) -> Iterator[tuple[str, str]]:
-        """create a generator for pages numbers and their url in chapter"""
+    def resolve_pages(self, chapter: Chapter, manga: Manga) -> list[Page]:
+        """return the pages of the chapter from a single fetch
+        vm.CurChapter already contains the number of pages and the directory"""
 
         chapter_name = chapter["name"]
         chapter_number = str(int(chapter_name[1:-1]))
         if chapter_name[-1] != "0":
             chapter_number += "." + chapter_name[-1]
         index = ("-index-" + chapter_name[0]) if chapter_name[0] != "1" else ""
+        true_name = manga["true name"]
 
-        page_number = 0
-        while True:
-            page_number += 1
-            url_page = (
-                self.page
-                + f"/read-online/{
-                manga["true name"]}-chapter-{chapter_number}{index}-page-{page_number}.html"
-            )
-            try:
-                response = requests.get(url_page, timeout=self.timeout)
-            except Exception as excp:
-                yield "", str(excp)
-                break
-
-            if response.status_code != 200:
-                break
-            page_text = response.text
-            if r"<title>404 Page Not Found</title>" in page_text:
-                break
-
-            server_name_group = re.search(r"vm.CurPathName = \"(.*?)\";", page_text)
-            server_directory_group = re.search(r"vm.CurChapter = (.*?);", page_text)
-            if not server_name_group or not server_directory_group:
-                yield "", "website cannot be reached"
-                break
-
-            server_name = server_name_group.group(1)
-            server_directory = server_directory_group.group(1).replace("null", "None")
-            server_directory = ast.literal_eval(server_directory)
-            chap_num = server_directory["Chapter"]
-            chap_num = (
-                chap_num[1:-1]
-                if chap_num[-1] == "0"
-                else chap_num[1:-1] + "." + chap_num[-1]
-            )
-            chap_dir = server_directory["Directory"]
-            chap_dir = chap_dir + "/" if chap_dir else chap_dir
-            image_link = f"https://{server_name}/manga/{manga["true name"]}/{
-                chap_dir}{chap_num}-{page_number:03d}.png"
+        url_page = (
+            self.page
+            + f"/read-online/{true_name}-chapter-{chapter_number}{index}-page-1.html"
+        )
+        response = SESSIONS.get(url_page, timeout=self.timeout)
 
-            yield f"{page_number:03d}", image_link
+        page_text = response.text
+        if response.status_code == 404 or r"<title>404 Page Not Found</title>" in page_text:
+            raise ChapterNotFound("chapter not found")
+        response.raise_for_status()
+
+        server_name, server_directory = CPU.run(_parse_chapter_page, page_text)
+        if not server_name or not server_directory:
+            raise SiteUnavailable("website cannot be reached")
+
+        chap_num = server_directory["Chapter"]
+        chap_num = (
+            chap_num[1:-1]
+            if chap_num[-1] == "0"
+            else chap_num[1:-1] + "." + chap_num[-1]
+        )
+        chap_dir = server_directory["Directory"]
+        chap_dir = chap_dir + "/" if chap_dir else chap_dir
+        number_pages = int(server_directory["Page"])
+
+        # the image server uses the same scheme as the website
+        scheme = self.page.split("://", 1)[0]
+        return [
+            Page(
+                f"{page_number:03d}",
+                f"{scheme}://{server_name}/manga/{true_name}/"
+                + f"{chap_dir}{chap_num}-{page_number:03d}.png",
+            )
+            for page_number in range(1, number_pages + 1)
+        ]
@@ -0,0 +1,90 @@
+"""trigram index used to search the titles of a manga directory"""
+
+import heapq
+
+
+class TitleIndex:
+    """index over the lowercased titles of a directory
+    a query is a list of words that have to appear in order in the title,
+    candidates come from the trigrams of the words and, when the query extends
+    the previous one, from the previous matches"""
+
+    def __init__(self, titles: list[str]) -> None:
+        self.titles = titles
+        self._trigrams: dict[str, list[int]] = {}
+        for position, title in enumerate(titles):
+            for trigram in {title[i : i + 3] for i in range(len(title) - 2)}:
+                self._trigrams.setdefault(trigram, []).append(position)
+        self._last_query = ""
+        self._last_matches: list[int] = list(range(len(titles)))
+
+    def search(self, query: str, max_len: int) -> list[int]:
+        """return the position of the best max_len titles matching the query"""
+
+        query = query.lower()
+        words = query.split()
+        if not words:
+            self._last_query, self._last_matches = "", list(range(len(self.titles)))
+            return self._last_matches[:max_len]
+
+        if self._last_query and query.startswith(self._last_query):
+            # the new query can only narrow down the previous matches
+            candidates = self._last_matches
+        else:
+            candidates = self._candidates(words)
+
+        matches = [
+            position
+            for position in candidates
+            if _ordered_find(self.titles[position], words) >= 0
+        ]
+        self._last_query, self._last_matches = query, matches
+
+        return heapq.nsmallest(
+            max_len, matches, key=lambda position: self._rank(position, words)
+        )
+
+    def _candidates(self, words: list[str]) -> list[int]:
+        """return the titles containing every trigram of the query words"""
+
+        postings = []
+        for word in words:
+            for i in range(len(word) - 2):
+                posting = self._trigrams.get(word[i : i + 3])
+                if posting is None:
+                    return []
+                postings.append(posting)
+
+        if not postings:
+            return list(range(len(self.titles)))
+
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                break
+        return sorted(candidates)
+
+    def _rank(self, position: int, words: list[str]) -> tuple:
+        """sort key of a match, best first"""
+
+        title = self.titles[position]
+        start = _ordered_find(title, words)
+        word_start = start == 0 or not title[start - 1].isalnum()
+        return (title != " ".join(words), start != 0, not word_start, start, len(title), position)
+
+
+def _ordered_find(title: str, words: list[str]) -> int:
+    """return the position of the first word if all words appear in order, else -1"""
+
+    position = start = title.find(words[0])
+    if position < 0:
+        return -1
+    position += len(words[0])
+    for word in words[1:]:
+        position = title.find(word, position)
+        if position < 0:
+            return -1
+        position += len(word)
+    return start
@@ -0,0 +1,94 @@
+"""selection of the chapters to download from an expression"""
+
+import re
+
+_NUMBER = r"\d+(?:\.\d+)?"
+_RANGE = re.compile(rf"({_NUMBER})?\s*-\s*({_NUMBER})?")
+
+
+def _parse_range(text: str) -> tuple[float, float]:
+    """return the bounds of "12", "10-20", "10-" or "-20", both included"""
+
+    if re.fullmatch(_NUMBER, text):
+        return float(text), float(text)
+    match = _RANGE.fullmatch(text)
+    if match is None or match.group(1) is None and match.group(2) is None:
+        raise ValueError(f"invalid chapter selection '{text}'")
+    low = float(match.group(1)) if match.group(1) else float("-inf")
+    high = float(match.group(2)) if match.group(2) else float("inf")
+    return low, high
+
+
+def _parse_term(term: str) -> tuple[str, float, float]:
+    """return the kind and the bounds of a term of the expression"""
+
+    term = term.strip().lower()
+    if term == "new":
+        return "new", 0, 0
+    match = re.fullmatch(r"(?:latest|last)\s*(\d+)", term)
+    if match is not None:
+        return "latest", int(match.group(1)), 0
+    match = re.fullmatch(r"vol(?:ume)?\.?\s*(.+)", term)
+    if match is not None:
+        return ("volume", *_parse_range(match.group(1).strip()))
+    return ("chapter", *_parse_range(term))
+
+
+class Selection:
+    """chapters selected by a comma separated union of terms:
+    12, 10-20, 10-, -20   chapter numbers, bounds included
+    latest 5              the 5 chapters with the highest numbers
+    new                   the chapters after the latest one of the previous runs
+    vol 3, vol 1-2        the chapters of the volumes
+    an empty expression selects every chapter
+    it only needs the list of chapters, so no chapter is fetched to apply it"""
+
+    def __init__(self, expression: str = "") -> None:
+        self.expression = expression
+        self.terms = [_parse_term(term) for term in expression.split(",") if term.strip()]
+
+    def __bool__(self) -> bool:
+        return bool(self.terms)
+
+    def apply(self, chapters: list[dict], known: set[str] = frozenset()) -> list[dict]:
+        """return the selected chapters in their order, known are the names of
+        the chapters downloaded by the previous runs"""
+
+        if not self.terms:
+            return chapters
+
+        numbers = [chapter.get("number") for chapter in chapters]
+        selected: set[int] = set()
+        for kind, low, high in self.terms:
+            if kind == "chapter":
+                selected.update(
+                    index
+                    for index, number in enumerate(numbers)
+                    if number is not None and low <= number <= high
+                )
+            elif kind == "volume":
+                selected.update(
+                    index
+                    for index, chapter in enumerate(chapters)
+                    if chapter.get("volume") is not None and low <= chapter["volume"] <= high
+                )
+            elif kind == "latest":
+                numbered = [index for index, number in enumerate(numbers) if number is not None]
+                numbered.sort(key=lambda index: numbers[index], reverse=True)
+                selected.update(numbered[: int(low)])
+            else:
+                last = max(
+                    (
+                        number
+                        for chapter, number in zip(chapters, numbers)
+                        if number is not None and chapter["name"] in known
+                    ),
+                    default=float("-inf"),
+                )
+                selected.update(
+                    index
+                    for index, number in enumerate(numbers)
+                    if number is not None and number > last
+                )
+
+        return [chapter for index, chapter in enumerate(chapters) if index in selected]
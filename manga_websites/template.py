@@ -3,33 +3,53 @@ TEMPLATE
 collection of manga websites and their attributes
 """
 
-from typing import Iterator
+from typing import Callable
+from .adapter import API_VERSION, Capabilities, Chapter, Manga, Page
 
 
 class NameOfTheManga:
     """name of the manga"""
 
-    name = ""
-    page = ""
-
-    def __init__(self) -> None:
+    name = ""  # also the key of the website in WEBSITES, in __init__.py
+    page = ""  # the urls of the website start with it, repeated in WEBSITES
+    api_version = API_VERSION  # adapters without it are driven through img_generator
+    # what the website supports, the downloader schedules the pages accordingly:
+    # the requests in flight for each host, Range requests to continue a partial page,
+    # whether resolve_pages knows every page at once, the headers of the page requests,
+    # and whether they need the page of the website as Referer
+    capabilities = Capabilities(
+        concurrency=0, ranges=False, page_count=True, headers={}, referer=False
+    )
+
+    def __init__(self, timeout: int) -> None:
         self.list_mangas = []  # total list of mangas (if available)
+        self.timeout = timeout
 
     def load_database(self) -> None:
         """load the database of mangas"""
         # to be executed at the beginning of the script, loads the entire database
 
-    def print_list(self, word_search: str, max_len: int = 100) -> list[tuple[str, str]]:
+    def print_list(
+        self,
+        word_search: str,
+        max_len: int = 100,
+        cancelled: Callable[[], bool] | None = None,
+    ) -> list[tuple[str, str]]:
         """return list of mangas"""
         # return a list of mangas that result from searching word_seach to be printed on the sceen, of length = max_len.
+        # cancelled returns True once the user has typed a newer word, slow searches should stop and return early.
 
-    def create_manga(self, url_manga: str) -> dict:
+    def create_manga(self, url_manga: str) -> Manga:
         """create manga dictionary with various attributes"""
-        # this function creates two important data structures:
-        # manga -> it must have 3 entries, website, name and list_chapters
-        # list_chapters -> list of dictionries, each of which must contain the name of the chapter
+        # this function creates two important data structures, see adapter.py:
+        # manga -> it must have 4 entries, website, name, url (the one given) and list_chapters
+        # list_chapters -> list of dictionries, each of which must contain the name of the chapter,
+        # its number and its volume (None when unknown) for the chapter selection
         # both dictionaries can be added more variables for internal use
 
-    def img_generator(self, chapter: dict, manga: dict) -> Iterator[tuple[str, str]]:
-        """create a generator for pages in chapter"""
-        # this function is a generator that returs 2 variables: the page number (formatted appropriately) and a response file obtained by requests.get(...)
+    def resolve_pages(self, chapter: Chapter, manga: Manga) -> list[Page]:
+        """return the pages of the chapter"""
+        # return the pages of the chapter in reading order, each with its number (formatted appropriately)
+        # and the url of its image. when capabilities.page_count is False it can be a generator instead.
+        # errors are raised: ChapterNotFound, SiteUnavailable (tried again later) or LayoutChanged,
+        # the http errors of SESSIONS are retried according to their status
@@ -0,0 +1,47 @@
+"""tests of the streaming writer of the chapter archives"""
+
+from zipfile import ZipFile
+from downloader.archive import ChapterArchive, check_archive
+
+
+def test_page_landed_twice(tmp_path) -> None:
+    """a page downloaded again by the final retry pass while its first copy
+    was still buffered is dropped, and the archive still closes"""
+
+    zip_path = str(tmp_path / "chapter.cbz")
+    archive = ChapterArchive(zip_path)
+    for page_str in ("001", "002", "003"):
+        archive.expect(page_str)
+
+    assert archive.add_page("002", [b"second"]) == 6
+    assert archive.has("002")
+    assert archive.add_page("001", [b"first"]) == 5
+    # 002 has been written behind 001 and is no longer expected
+    assert archive.add_page("002", [b"second again"]) == 0
+    assert archive.add_page("003", [b"third"]) == 5
+    archive.close()
+
+    assert check_archive(zip_path)
+    with ZipFile(zip_path) as zip_file:
+        assert [zip_file.read(name) for name in sorted(zip_file.namelist())] == [
+            b"first",
+            b"second",
+            b"third",
+        ]
+
+
+def test_page_buffered_twice(tmp_path) -> None:
+    """a second copy of a page still waiting in the buffer is dropped"""
+
+    zip_path = str(tmp_path / "chapter.cbz")
+    archive = ChapterArchive(zip_path)
+    for page_str in ("001", "002"):
+        archive.expect(page_str)
+
+    archive.add_page("002", [b"second"])
+    assert archive.add_page("002", [b"second again"]) == 0
+    archive.add_page("001", [b"first"])
+    archive.close()
+
+    with ZipFile(zip_path) as zip_file:
+        assert zip_file.read("002.png") == b"second"